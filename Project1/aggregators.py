@@ -0,0 +1,198 @@
+# imports
+import numpy as np
+from typing import Dict, List
+from transaction_table import TransactionTable, to_text
+from sketch import GroupSketches, hash_text
+from interning import Interner
+
+#################################################### Aggregators ##############################################
+#
+# Incremental versions of the per token / per buyer aggregations of the queries. Each aggregator is fed the
+# transactions a batch at a time through update() and only keeps its per group state, so results can be computed
+# over more transactions than fit in memory. Groups are reported in the order they were first seen, which is the
+# order process_data groups the transactions in.
+#
+# Buyers, NFTs and txn hashes are kept as their interned codes, so every batch has to be encoded with the same
+# interners (the chunks of one stream, or slices of one table). Buyers are only decoded when the results are read.
+
+class TxnCountAggregator:
+    # Query 1: number of distinct transactions per token
+    def __init__(self) -> None:
+        self.txn_hashes: Dict[int, set] = {}
+
+    def update(self, data: TransactionTable) -> None:
+        for token_id, txn_hash in zip(data.token_id.tolist(), data.txn_hash.tolist()):
+            if token_id in self.txn_hashes:
+                self.txn_hashes[token_id].add(txn_hash)
+            else:
+                self.txn_hashes[token_id] = {txn_hash}
+
+    def results(self) -> List[tuple]:
+        return [(token_id, len(txn_hashes)) for token_id, txn_hashes in self.txn_hashes.items()]
+
+class AveragePriceAggregator:
+    # Query 2: average price per token, weighted by quantity. The running totals of the tokens are arrays indexed by
+    # their order of first appearance
+    def __init__(self) -> None:
+        self.tokens = Interner()
+        self.totals = np.zeros(0, dtype=np.float64)
+        self.counts = np.zeros(0, dtype=np.int64)
+
+    def update(self, data: TransactionTable) -> None:
+        groups = self.tokens.intern(data.token_id)
+        # the running totals are summed in first, so every total is added up in row order as a running sum would be
+        known = np.arange(len(self.totals))
+        self.totals = np.bincount(np.concatenate((known, groups)), weights=np.concatenate((self.totals, data.price * data.quantity)),
+                                  minlength=len(self.tokens))
+        counts = np.bincount(groups, weights=data.quantity, minlength=len(self.tokens)).astype(np.int64)
+        counts[:len(self.counts)] += self.counts
+        self.counts = counts
+
+    def results(self) -> List[tuple]:
+        # a token whose quantities add up to 0 has no average price, it is given 0
+        averages = np.divide(self.totals, self.counts, out=np.zeros(len(self.totals)), where=self.counts != 0)
+        return list(zip(np.asarray(self.tokens).tolist(), averages.tolist()))
+
+class BuyerTxnAggregator:
+    # Query 3: number of transactions per buyer
+    def __init__(self) -> None:
+        self.counts: Dict[int, int] = {}
+        self.buyers = None
+
+    def update(self, data: TransactionTable) -> None:
+        self.buyers = data.vocab['buyer']
+        for buyer in data.buyer.tolist():
+            self.counts[buyer] = self.counts.get(buyer, 0) + 1
+
+    def results(self) -> List[tuple]:
+        # (buyer, buyer code, number of transactions)
+        buyers = to_text(self.buyers[np.array(list(self.counts), dtype=np.int64)]).tolist()
+        return [(buyer, code, count) for buyer, (code, count) in zip(buyers, self.counts.items())]
+
+class UniqueBuyerAggregator:
+    # Query 4: number of distinct buyers per token
+    def __init__(self) -> None:
+        self.buyers: Dict[int, set] = {}
+
+    def update(self, data: TransactionTable) -> None:
+        for token_id, buyer in zip(data.token_id.tolist(), data.buyer.tolist()):
+            if token_id in self.buyers:
+                self.buyers[token_id].add(buyer)
+            else:
+                self.buyers[token_id] = {buyer}
+
+    def results(self) -> List[tuple]:
+        return [(token_id, len(buyers)) for token_id, buyers in self.buyers.items()]
+
+class BuyerNftAggregator:
+    # Query 5: number of distinct NFTs and number of transactions per buyer
+    def __init__(self) -> None:
+        self.nfts: Dict[int, set] = {}
+        self.counts: Dict[int, int] = {}
+        self.buyers = None
+
+    def update(self, data: TransactionTable) -> None:
+        self.buyers = data.vocab['buyer']
+        for buyer, nft in zip(data.buyer.tolist(), data.nft.tolist()):
+            if buyer in self.nfts:
+                self.nfts[buyer].add(nft)
+                self.counts[buyer] += 1
+            else:
+                self.nfts[buyer] = {nft}
+                self.counts[buyer] = 1
+
+    def results(self) -> List[tuple]:
+        buyers = to_text(self.buyers[np.array(list(self.nfts), dtype=np.int64)]).tolist()
+        return [(buyer, len(nfts), self.counts[code]) for buyer, (code, nfts) in zip(buyers, self.nfts.items())]
+
+def text_hashes(data: TransactionTable, column: str) -> np.ndarray:
+    # hash of the text of every row of a coded column, every distinct code is only decoded and hashed once
+    used, rows = np.unique(getattr(data, column), return_inverse=True)
+    return hash_text(data.text(column, used))[rows]
+
+class ApproximateUniqueBuyerAggregator:
+    # Query 4 in fixed memory: approximate number of distinct buyers per token, within a relative standard error
+    def __init__(self, error: float = 0.05) -> None:
+        self.sketches = GroupSketches(error)
+
+    def update(self, data: TransactionTable) -> None:
+        self.sketches.add(data.token_id, text_hashes(data, 'buyer'))
+
+    def results(self) -> List[tuple]:
+        # (token_id, estimated number of buyers, standard error of the estimate)
+        estimates = self.sketches.estimates()
+        errors = estimates * self.sketches.error()
+        return list(zip(self.sketches.keys().tolist(), np.rint(estimates).astype(np.int64).tolist(), errors.tolist()))
+
+class ApproximateBuyerNftAggregator:
+    # Query 5 in fixed memory: approximate number of distinct NFTs and the number of transactions per buyer
+    def __init__(self, error: float = 0.05) -> None:
+        self.sketches = GroupSketches(error)
+        self.counts = np.zeros(0, dtype=np.int64)
+
+    def update(self, data: TransactionTable) -> None:
+        # the buyers are kept by their text so that the sketches of different runs can be merged
+        used, rows = np.unique(data.buyer, return_inverse=True)
+        buyers = np.asarray(data.text('buyer', used), dtype=object)[rows]
+        groups = self.sketches.add(buyers, text_hashes(data, 'nft'))
+
+        counts = np.bincount(groups, minlength=len(self.sketches))
+        counts[:len(self.counts)] += self.counts
+        self.counts = counts
+
+    def results(self) -> List[tuple]:
+        # (buyer, estimated number of NFTs, number of transactions, standard error of the estimate)
+        estimates = self.sketches.estimates()
+        errors = estimates * self.sketches.error()
+        return list(zip(self.sketches.keys().tolist(), np.rint(estimates).astype(np.int64).tolist(),
+                        self.counts.tolist(), errors.tolist()))
+
+class FraudFeatureAggregator:
+    # Query 6: distinct transactions and buyers per token, with the first and the last three buy dates. Dates are
+    # kept as (date, minutes since the epoch) pairs
+    def __init__(self) -> None:
+        self.txn_hashes: Dict[int, set] = {}
+        self.buyers: Dict[int, set] = {}
+        self.first_dates: Dict[int, tuple] = {}
+        self.last_dates: Dict[int, list] = {}
+
+    def update(self, data: TransactionTable) -> None:
+        dates = zip(data.decode('date_time'), data.date_minutes.tolist())
+        rows = zip(data.token_id.tolist(), data.txn_hash.tolist(), data.buyer.tolist(), dates)
+        for token_id, txn_hash, buyer, date in rows:
+            if token_id in self.txn_hashes:
+                self.txn_hashes[token_id].add(txn_hash)
+                self.buyers[token_id].add(buyer)
+                # only the last three dates are ever needed
+                last_dates = self.last_dates[token_id]
+                last_dates.append(date)
+                if len(last_dates) > 3:
+                    del last_dates[0]
+            else:
+                self.txn_hashes[token_id] = {txn_hash}
+                self.buyers[token_id] = {buyer}
+                self.first_dates[token_id] = date
+                self.last_dates[token_id] = [date]
+
+    def results(self) -> List[tuple]:
+        # (token_id, first, last, second last and third last date, number of transactions, number of buyers,
+        # minutes of those four dates)
+        results = []
+        for token_id, txn_hashes in self.txn_hashes.items():
+            # pad with None for tokens with fewer than three transactions
+            dates = [self.first_dates[token_id]] + ([(None, None), (None, None)] + self.last_dates[token_id])[:-4:-1]
+            date_times, minutes = zip(*dates)
+            results.append((token_id, *date_times, len(txn_hashes), len(self.buyers[token_id]), minutes))
+
+        return results
+
+# Rows fed to the aggregators at a time by feed
+DEFAULT_BATCH_SIZE = 100000
+
+def feed(aggregators: list, data: TransactionTable, batch_size: int = DEFAULT_BATCH_SIZE) -> None:
+    # Feed a whole table to several aggregators a batch of rows at a time, so the table is read once and every batch
+    # is still in memory when the next aggregator gets it
+    for start in range(0, len(data), batch_size):
+        batch = data[start: start + batch_size]
+        for aggregator in aggregators:
+            aggregator.update(batch)
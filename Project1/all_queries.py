@@ -0,0 +1,91 @@
+# imports
+import os
+import time
+import argparse
+import query1
+import query2
+import query3
+import query4
+import query5
+import query6
+from dataset import load_transactions, load_row_index
+from stream import stream_into, DEFAULT_CHUNKSIZE
+from sharding import run_sharded
+from aggregators import (TxnCountAggregator, AveragePriceAggregator, BuyerTxnAggregator, UniqueBuyerAggregator,
+                         BuyerNftAggregator, FraudFeatureAggregator)
+
+# Runs Query1 - Query6 together. The transactions are read once and every query is computed from them in one pass:
+# in memory the table is grouped once by token and once by buyer, from the cached row indexes, and the aggregations
+# of every query that groups by that key are read off the same grouped rows (on hash shards of them in worker
+# processes with --workers). When streamed, every chunk is fed to the aggregators of all six queries. Then each
+# query sorts and saves its results the way it does when run on its own
+
+# Every query with the aggregator of its per group results, the column it groups by and the aggregation of the
+# transactions grouped by that column
+QUERIES = [
+    (query1, TxnCountAggregator, 'token_id', query1.update_with_n_txns),
+    (query2, AveragePriceAggregator, 'token_id', query2.update_with_avg),
+    (query3, BuyerTxnAggregator, 'buyer', query3.update_with_n_txns),
+    (query4, UniqueBuyerAggregator, 'token_id', query4.update_with_n_unique_buyers),
+    (query5, BuyerNftAggregator, 'buyer', query5.update_with_n_unique_nfts_without_nft_names),
+    (query6, FraudFeatureAggregator, 'token_id', query6.update_with_n_unique_txns),
+]
+
+# the columns the queries group by
+KEY_COLUMNS = ['token_id', 'buyer']
+
+def main(stream=False, chunksize=DEFAULT_CHUNKSIZE, workers=None):
+    if stream:
+        # the transactions themselves are not kept, so only the per group results are saved
+        aggregators = [aggregator() for _, aggregator, _, _ in QUERIES]
+        n = stream_into(root_path, aggregators, chunksize)
+        print(f"{n} transactions")
+
+        transactions, indexes = None, {}
+        results = [query.aggregated_data(aggregator) for (query, _, _, _), aggregator in zip(QUERIES, aggregators)]
+    else:
+        transactions = load_transactions(root_path)
+        print(f"{len(transactions)} transactions")
+
+        # the rows of every token and every buyer, built once per dataset, group the table for all the queries and
+        # are used again to save the results
+        indexes = {column: load_row_index(root_path, transactions, column) for column in KEY_COLUMNS}
+        if workers:
+            # every query runs on shards of the grouped rows in the worker processes of one pool
+            results = run_sharded(root_path, [(query.process_data, column) for query, _, column, _ in QUERIES], indexes, workers)
+        else:
+            # the rows are gathered into groups once per key, and every query that groups by it aggregates them
+            grouped = {column: transactions[index.order] for column, index in indexes.items()}
+            results = [update(grouped[column], indexes[column].offsets) for _, _, column, update in QUERIES]
+
+    for (query, _, column, _), data in zip(QUERIES, results):
+        # collect start time
+        start_time = time.time_ns()
+        sorted_txns = query.sort_data(data)
+        # collect end time
+        end_time = time.time_ns()
+
+        elapsed_time = (end_time - start_time)
+        print(f"{query.__name__}: the elapsed time is {elapsed_time} nano secs (i.e {elapsed_time/1e9} secs)")
+
+        # the queries write their results to their module's output path
+        query.output_path = output_path
+        query.save_result(sorted_txns, transactions, elapsed_time, indexes.get(column))
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--stream", action="store_true", help="read the csv files in chunks instead of all at once")
+    parser.add_argument("--chunksize", type=int, default=DEFAULT_CHUNKSIZE, help="rows per chunk in streaming mode")
+    parser.add_argument("--workers", type=int, default=None, help="aggregate hash shards of the transactions in this many processes")
+    args = parser.parse_args()
+
+    # declare root path
+    root_path = os.getcwd()
+
+    # Output path to store results
+    output_path = root_path + "/output"
+
+    if not os.path.isdir(output_path):
+        os.mkdir(output_path)
+
+    main(args.stream, args.chunksize, args.workers)
@@ -0,0 +1,33 @@
+# imports
+import os
+import time
+from dataset import load_transactions
+
+# Times building the records save_result writes out: a row() call per row, as save_result did before, against
+# building all of them at once with rows()
+
+def rows_one_by_one(transactions):
+    return [transactions.row(i) for i in range(len(transactions))]
+
+def rows_at_once(transactions):
+    return transactions.rows()
+
+def time_ns(function, data, runs):
+    # best of runs, in nano secs
+    elapsed_times = []
+    for i in range(runs):
+        start_time = time.time_ns()
+        function(data)
+        elapsed_times.append(time.time_ns() - start_time)
+
+    return min(elapsed_times)
+
+if __name__ == "__main__":
+    transactions = load_transactions(os.getcwd())
+
+    one_by_one_time = time_ns(rows_one_by_one, transactions, runs=3)
+    at_once_time = time_ns(rows_at_once, transactions, runs=3)
+
+    print(f"{len(transactions)} transactions")
+    print(f"row() per row: {one_by_one_time/1e9} secs")
+    print(f"rows():        {at_once_time/1e9} secs ({one_by_one_time/at_once_time:.1f}x faster)")
@@ -0,0 +1,30 @@
+# imports
+import os
+import hashlib
+import numpy as np
+from column_file import write_column_file, open_column_file
+from typing import Dict, List
+
+# Bump this whenever the cleaning or conversion steps change, so older caches are not picked up
+CACHE_VERSION = 5
+CACHE_DIR = ".cache"
+
+def fingerprint(files: List[str]) -> str:
+    # The cache is keyed by the name, size and modification time of every input file
+    digest = hashlib.sha1(f"v{CACHE_VERSION}".encode())
+    for f in sorted(files):
+        stat = os.stat(f)
+        digest.update(f"{os.path.basename(f)}:{stat.st_size}:{stat.st_mtime_ns}\n".encode())
+
+    return digest.hexdigest()[:16]
+
+def get_cache_path(root_path: str, files: List[str], name: str) -> str:
+    return os.path.join(root_path, CACHE_DIR, f"{name}-{fingerprint(files)}.cols")
+
+def save_columns(path: str, columns: Dict[str, np.ndarray]) -> None:
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    write_column_file(path, columns)
+
+def load_columns(path: str, decode_text: bool = False) -> Dict[str, np.ndarray]:
+    # The columns are read only views of a memory map of the cache file, see column_file.py
+    return open_column_file(path, decode_text=decode_text)
@@ -0,0 +1,105 @@
+# imports
+import os
+import json
+import tempfile
+import numpy as np
+from typing import Dict
+
+##################################################### Format ###################################################
+#
+# A column file is a small header followed by one fixed width segment per column:
+#
+#   magic (8 bytes) | header length (8 bytes, little endian) | header (json) | padding | segment | padding | segment ...
+#
+# The header lists the name, dtype, length and byte offset of every segment. Segments start on a 64 byte boundary so
+# that every column can be handed out as an aligned view of a single read only memory map: nothing is copied when
+# the file is opened, pages are only read when a column is touched, and processes that open the same file share
+# those pages through the OS page cache. Strings are stored utf-8 encoded in fixed width byte columns ("S<width>")
+
+MAGIC = b"NFTCOL01"
+ALIGNMENT = 64
+
+# the umask of the process, which can only be read by setting it
+UMASK = os.umask(0)
+os.umask(UMASK)
+
+def padding(offset: int) -> int:
+    return -offset % ALIGNMENT
+
+def to_fixed_width(values: np.ndarray) -> np.ndarray:
+    if values.dtype == object or values.dtype.kind == 'U':
+        return np.char.encode(values.astype(str), 'utf-8') if len(values) else np.empty(0, dtype='S1')
+
+    return np.ascontiguousarray(values)
+
+def write_column_file(path: str, columns: Dict[str, np.ndarray]) -> None:
+    arrays = {name: to_fixed_width(values) for name, values in columns.items()}
+
+    # Lay the segments out first: the header has to know every offset, and the offsets depend on the header size
+    entries = []
+    for name, values in arrays.items():
+        entries.append({
+            'name': name,
+            'dtype': values.dtype.str,
+            'length': len(values),
+            'text': columns[name].dtype == object or columns[name].dtype.kind in 'US',
+        })
+
+    header_size = 0
+    while True:
+        offset = len(MAGIC) + 8 + header_size
+        offset += padding(offset)
+        for entry, values in zip(entries, arrays.values()):
+            entry['offset'] = offset
+            offset += values.nbytes + padding(values.nbytes)
+
+        header = json.dumps({'columns': entries}).encode()
+        if len(header) <= header_size:
+            break
+        header_size = len(header)
+
+    # Write to a temporary file of this process first, then move it in place: an interrupted run never leaves a half
+    # written file behind, and processes that build the same file at once neither write over each other nor let a
+    # reader map a file that is still being written
+    fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path) or ".", prefix=os.path.basename(path), suffix=".tmp")
+    try:
+        with os.fdopen(fd, "wb") as file:
+            file.write(MAGIC)
+            file.write(header_size.to_bytes(8, 'little'))
+            file.write(header.ljust(header_size))
+
+            for entry, values in zip(entries, arrays.values()):
+                file.write(b"\0" * (entry['offset'] - file.tell()))
+                values.tofile(file)
+        # mkstemp makes the file private, give it the permissions open() would have
+        os.chmod(tmp_path, 0o666 & ~UMASK)
+        os.replace(tmp_path, path)
+    except BaseException:
+        os.remove(tmp_path)
+        raise
+
+def read_header(path: str) -> dict:
+    with open(path, "rb") as file:
+        if file.read(len(MAGIC)) != MAGIC:
+            raise ValueError(f"{path} is not a column file")
+        header_size = int.from_bytes(file.read(8), 'little')
+        return json.loads(file.read(header_size))
+
+def open_column_file(path: str, decode_text: bool = False) -> Dict[str, np.ndarray]:
+    header = read_header(path)
+
+    # One memory map for the whole file, every column is a view into it
+    buffer = np.memmap(path, dtype=np.uint8, mode='r')
+
+    columns = {}
+    for entry in header['columns']:
+        dtype = np.dtype(entry['dtype'])
+        start = entry['offset']
+        end = start + entry['length'] * dtype.itemsize
+        columns[entry['name']] = buffer[start:end].view(dtype)
+
+        # Decoding text makes an in memory copy of the column, callers that can work on the bytes should not ask for it
+        if decode_text and entry['text']:
+            columns[entry['name']] = np.char.decode(columns[entry['name']], 'utf-8').astype(object)
+
+    return columns
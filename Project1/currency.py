@@ -0,0 +1,63 @@
+# imports
+import pandas as pd
+import numpy as np
+
+# USD rate for every currency quoted in the Price column, e.g "0.05 ETH ($65.50)".
+# Any other currency is taken to be USD already
+CURRENCY_RATES = {
+    "ETH": 1309.97,
+    "WETH": 1322.16,
+    "ASH": 0.9406,
+    "GALA": 0.03748,
+    "TATR": 0.012056,
+    "USDC": 1.00,
+    "MANA": 0.64205,
+    "SAND": 0.7919,
+    "RARI": 2.18,
+    "CTZN": 0.00321,
+    "APE": 4.62,
+}
+
+DEFAULT_RATE = 1.00
+
+def parse_amounts(amounts: np.ndarray) -> np.ndarray:
+    # astype parses with float() itself, so the values match the old per-row conversion to the last digit.
+    # Only when some amount is not a number do we pay for finding out which ones
+    try:
+        return amounts.astype(np.float64)
+    except (TypeError, ValueError):
+        is_number = pd.to_numeric(pd.Series(amounts), errors='coerce').notna().to_numpy()
+        parsed = np.full(len(amounts), np.nan)
+        parsed[is_number] = amounts[is_number].astype(np.float64)
+        return parsed
+
+def convert_prices(prices) -> np.ndarray:
+    prices = pd.Series(prices, copy=False).reset_index(drop=True)
+    converted = np.zeros(len(prices), dtype=np.float64)
+
+    # Numbers are already in USD
+    is_text = (prices.map(type) == str).to_numpy()
+    converted[~is_text] = prices[~is_text].astype(np.float64).to_numpy()
+
+    if not is_text.any():
+        return converted
+
+    # Split every price string once into its amount, currency and USD hint. Anything that is not made up of
+    # exactly three parts, or whose amount is not a number, is left at 0.0
+    text = prices[is_text].astype(object)
+    parts = text.str.split(" ", n=2, expand=True).reindex(columns=[0, 1, 2])
+    is_valid = (text.str.count(" ") == 2).to_numpy()
+
+    amounts = parse_amounts(parts[0].str.replace(",", "", regex=False).to_numpy(dtype=object))
+    rates = parts[1].map(CURRENCY_RATES).fillna(DEFAULT_RATE).to_numpy(dtype=np.float64)
+
+    text_prices = amounts * rates
+    text_prices[~is_valid | np.isnan(amounts)] = 0.0
+
+    # A bare number, as read from a Price column of plain amounts, is already in USD
+    amounts = parse_amounts(text.str.strip().to_numpy(dtype=object))
+    is_number = ~np.isnan(amounts)
+    text_prices[is_number] = amounts[is_number] * DEFAULT_RATE
+    converted[is_text] = text_prices
+
+    return converted
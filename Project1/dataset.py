@@ -0,0 +1,83 @@
+# imports
+import numpy as np
+import glob
+import os
+from typing import Optional
+from concurrent.futures import ProcessPoolExecutor
+from schema import read_transactions, drop_nulls
+from cache import get_cache_path, save_columns, load_columns
+from transaction_table import TransactionTable, prepare_data, currency_converter, concat_tables
+from grouping import RowIndex, row_index
+from dedupe import Deduplicator, transaction_keys
+
+def read_file(f) -> TransactionTable:
+    data = read_transactions(f)
+    # drop all null records
+    data = drop_nulls(data)
+
+    # prepare data accordingly as per data types and get required columns
+    transactions = prepare_data(data)
+    return currency_converter(transactions)
+
+def read_and_clean(files, workers: Optional[int] = None, bloom_capacity: Optional[int] = None,
+                   exact: bool = True) -> TransactionTable:
+    # The files are parsed, cleaned and converted in parallel worker processes. map() hands the tables back in the
+    # order of the files, so the rows end up in the same order as when the files are read one after another
+    workers = min(workers or os.cpu_count() or 1, len(files))
+    if workers > 1:
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            tables = list(executor.map(read_file, files))
+    else:
+        tables = [read_file(f) for f in files]
+
+    transactions = concat_tables(tables)
+
+    # Duplicates are dropped once all the files are read, one file after another so every file's count is known.
+    # The codes of the merged table identify a hash or a buyer across all of the files. bloom_capacity and exact are
+    # the Bloom filter options of the Deduplicator
+    deduplicator = Deduplicator(bloom_capacity, exact=exact)
+    keys = transaction_keys({name: getattr(transactions, name) for name in ['txn_hash', 'token_id', 'buyer']})
+    bounds = np.cumsum([0] + [len(table) for table in tables])
+    is_new = [deduplicator.is_new(keys[start: end], os.path.basename(f)) for f, start, end in zip(files, bounds, bounds[1:])]
+    print(deduplicator.report())
+
+    return transactions[np.concatenate(is_new)]
+
+def load_transactions(root_path: str, use_cache: bool = True, workers: Optional[int] = None,
+                      bloom_capacity: Optional[int] = None, exact: bool = True) -> TransactionTable:
+    # getting all the input files
+    files = glob.glob(root_path + "/*.csv")
+
+    # The cleaned and converted table is cached on disk, keyed by the input files, so later runs skip the parsing.
+    # The cache is opened as a memory map: the columns are not read into memory up front, transactions[0: n] is a
+    # view of the first n rows, and runs of different queries share the pages of the file
+    # Without the exact key set a few unique transactions may be dropped, so those tables are cached apart
+    name = "transactions" if exact else f"transactions-bloom-{bloom_capacity}"
+    cache_path = get_cache_path(root_path, files, name)
+    if use_cache and os.path.isfile(cache_path):
+        return TransactionTable.from_columns(load_columns(cache_path))
+
+    transactions = read_and_clean(files, workers, bloom_capacity, exact)
+
+    if use_cache:
+        save_columns(cache_path, transactions.to_columns())
+        return TransactionTable.from_columns(load_columns(cache_path))
+
+    return transactions
+
+def load_row_index(root_path: str, transactions: TransactionTable, key: str = 'token_id', use_cache: bool = True) -> RowIndex:
+    # The rows of every token or buyer are cached next to the transactions they index, so the grouping is done once
+    # per dataset instead of every time the results are saved
+    files = glob.glob(root_path + "/*.csv")
+
+    cache_path = get_cache_path(root_path, files, f"rows-{key}")
+    if use_cache and os.path.isfile(cache_path):
+        index = RowIndex.from_columns(load_columns(cache_path))
+        if index.n_rows() == len(transactions):
+            return index
+
+    index = row_index(getattr(transactions, key))
+    if use_cache:
+        save_columns(cache_path, index.to_columns())
+
+    return index
@@ -0,0 +1,103 @@
+# imports
+import pandas as pd
+import numpy as np
+from typing import Dict, List, Optional
+
+# A transaction is identified by its hash, the token and the buyer. Rows with the same key are the same transaction
+# read twice, only the first one is kept
+KEY_COLUMNS = ['Txn Hash', 'Token ID', 'Buyer']
+
+def transaction_keys(columns) -> np.ndarray:
+    # One 64 bit hash per row of the key columns. Categories and strings hash by their values, so the same
+    # transaction gets the same key in every file and chunk
+    return pd.util.hash_pandas_object(pd.DataFrame(columns), index=False).to_numpy()
+
+class KeySet:
+    # Compact set of 64 bit keys: a few sorted uint64 runs, merged like a binary counter so a run is only merged
+    # with one of at least its size. Adding n keys takes O(n log n) and a lookup searches O(log n) runs
+    def __init__(self) -> None:
+        self.runs: List[np.ndarray] = []
+
+    def __len__(self) -> int:
+        return sum(len(run) for run in self.runs)
+
+    def contains(self, keys: np.ndarray) -> np.ndarray:
+        found = np.zeros(len(keys), dtype=bool)
+        for run in self.runs:
+            positions = np.searchsorted(run, keys)
+            found |= run[np.minimum(positions, len(run) - 1)] == keys
+
+        return found
+
+    def add(self, keys: np.ndarray) -> None:
+        # keys must be distinct and not in the set yet
+        if len(keys) == 0:
+            return
+
+        run = np.sort(keys)
+        while self.runs and len(self.runs[-1]) <= len(run):
+            run = np.sort(np.concatenate((self.runs.pop(), run)))
+        self.runs.append(run)
+
+class BloomFilter:
+    # Fixed size bit array, k bit positions per key from double hashing the two halves of the key. A key that is
+    # not in the filter was never added, a key that is may have been (with probability of about error_rate)
+    def __init__(self, capacity: int, error_rate: float = 0.001) -> None:
+        self.n_bits = max(64, int(-capacity * np.log(error_rate) / np.log(2) ** 2))
+        self.n_hashes = max(1, round(self.n_bits / capacity * np.log(2)))
+        self.bits = np.zeros((self.n_bits + 7) // 8, dtype=np.uint8)
+
+    def positions(self, keys: np.ndarray) -> np.ndarray:
+        h1 = keys & np.uint64(0xFFFFFFFF)
+        h2 = (keys >> np.uint64(32)) | np.uint64(1)
+        i = np.arange(self.n_hashes, dtype=np.uint64)[:, None]
+        return (h1 + i * h2) % np.uint64(self.n_bits)
+
+    def contains(self, keys: np.ndarray) -> np.ndarray:
+        positions = self.positions(keys)
+        bits = self.bits[positions >> np.uint64(3)] >> (positions & np.uint64(7)).astype(np.uint8)
+        return (bits & 1).astype(bool).all(axis=0)
+
+    def add(self, keys: np.ndarray) -> None:
+        positions = self.positions(keys).ravel()
+        np.bitwise_or.at(self.bits, positions >> np.uint64(3), np.left_shift(1, positions & np.uint64(7)).astype(np.uint8))
+
+class Deduplicator:
+    # Drops the transactions already seen, in this batch or any earlier one, so files and chunks can be
+    # deduplicated as they are read. Keys are kept in a KeySet. With a bloom_capacity, a Bloom filter is checked
+    # first and only keys it may have seen are looked up in the set; with exact=False the set is not kept at all,
+    # which bounds the memory to the filter at the cost of dropping about error_rate of the unique transactions
+    def __init__(self, bloom_capacity: Optional[int] = None, error_rate: float = 0.001, exact: bool = True) -> None:
+        if not exact and bloom_capacity is None:
+            raise ValueError("a Bloom filter capacity is needed when the keys are not kept")
+
+        self.keys = KeySet() if exact else None
+        self.bloom = BloomFilter(bloom_capacity, error_rate) if bloom_capacity is not None else None
+        # number of duplicates dropped per source, in the order the sources were first seen
+        self.duplicates: Dict[str, int] = {}
+
+    def is_new(self, keys: np.ndarray, source: str = "") -> np.ndarray:
+        # Mask of the rows to keep: the first row of every key that was not seen before
+        _, first = np.unique(keys, return_index=True)
+        is_new = np.zeros(len(keys), dtype=bool)
+        is_new[first] = True
+
+        candidates = np.flatnonzero(is_new)
+        seen = np.ones(len(candidates), dtype=bool)
+        if self.bloom is not None:
+            seen = self.bloom.contains(keys[candidates])
+        if self.keys is not None:
+            seen[seen] = self.keys.contains(keys[candidates[seen]])
+        is_new[candidates[seen]] = False
+
+        new_keys = keys[is_new]
+        if self.bloom is not None:
+            self.bloom.add(new_keys)
+        if self.keys is not None:
+            self.keys.add(new_keys)
+
+        self.duplicates[source] = self.duplicates.get(source, 0) + int(len(keys) - is_new.sum())
+        return is_new
+
+    def report(self) -> str:
+        return "\n".join(f"{source}: {n} duplicate transactions dropped" for source, n in self.duplicates.items())
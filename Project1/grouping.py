@@ -0,0 +1,163 @@
+# imports
+import pandas as pd
+import numpy as np
+from dataclasses import dataclass
+from typing import Dict
+
+#################################################### Group by ##############################################
+#
+# The queries group the transactions by token or buyer, with the groups in the order their keys first appear and
+# the rows of a group in their original order. group_by returns that grouping in CSR form: order lists the row
+# numbers group after group and the rows of group g are order[offsets[g]: offsets[g + 1]].
+
+@dataclass
+class Groups:
+    keys: np.ndarray        # key of every group, in order of first appearance
+    codes: np.ndarray       # group of every row
+    order: np.ndarray       # row numbers, grouped
+    offsets: np.ndarray     # start of every group in order, followed by the number of rows
+
+    def __len__(self) -> int:
+        return len(self.keys)
+
+    def sizes(self) -> np.ndarray:
+        return np.diff(self.offsets)
+
+    def rows(self, g: int) -> np.ndarray:
+        return self.order[self.offsets[g]: self.offsets[g + 1]]
+
+def group_by(values: np.ndarray) -> Groups:
+    # factorize numbers the keys in order of first appearance with one hash table pass, a stable sort of those
+    # numbers then keeps the rows of every group in order
+    codes, keys = pd.factorize(values)
+    order = np.argsort(codes, kind='stable')
+
+    offsets = np.zeros(len(keys) + 1, dtype=np.int64)
+    np.cumsum(np.bincount(codes, minlength=len(keys)), out=offsets[1:])
+
+    return Groups(keys=np.asarray(keys), codes=codes, order=order, offsets=offsets)
+
+#################################################### Row index ##############################################
+#
+# The rows of every token or buyer, for writing the transactions of a group out. It is the same grouping as
+# group_by, so it is built once per dataset and cached next to the transactions instead of being rebuilt by every
+# save. index[key] returns the row numbers of the key, in their original order.
+
+@dataclass
+class RowIndex:
+    keys: np.ndarray
+    order: np.ndarray
+    offsets: np.ndarray
+
+    def __post_init__(self) -> None:
+        self.groups = dict(zip(self.keys.tolist(), range(len(self.keys))))
+
+    def __len__(self) -> int:
+        return len(self.keys)
+
+    def __getitem__(self, key) -> np.ndarray:
+        g = self.groups[key]
+        return self.order[self.offsets[g]: self.offsets[g + 1]]
+
+    def n_rows(self) -> int:
+        return int(self.offsets[-1])
+
+    def relabel(self, keys: np.ndarray) -> "RowIndex":
+        # the same index looked up by other keys, e.g. buyer text instead of buyer codes
+        return RowIndex(keys=np.asarray(keys), order=self.order, offsets=self.offsets)
+
+    def to_columns(self) -> Dict[str, np.ndarray]:
+        return {'keys': self.keys, 'order': self.order, 'offsets': self.offsets}
+
+    @classmethod
+    def from_columns(cls, columns: Dict[str, np.ndarray]) -> "RowIndex":
+        return cls(keys=columns['keys'], order=columns['order'], offsets=columns['offsets'])
+
+def row_index(values: np.ndarray) -> RowIndex:
+    groups = group_by(values)
+    return RowIndex(keys=groups.keys, order=groups.order, offsets=groups.offsets)
+
+############################################ Aggregations ##############################################
+#
+# Per group aggregations over the columns of a table whose rows are already grouped (table[group_by(...).order]).
+# A group is a run of equal keys and is described by offsets, as in Groups. Every aggregation is one vectorised pass.
+
+def run_offsets(keys: np.ndarray) -> np.ndarray:
+    # offsets of the runs of equal adjacent keys
+    starts = np.flatnonzero(keys[1:] != keys[:-1]) + 1
+    return np.concatenate(([0], starts, [len(keys)])) if len(keys) else np.zeros(1, dtype=np.int64)
+
+def group_firsts(values: np.ndarray, offsets: np.ndarray) -> np.ndarray:
+    return values[offsets[:-1]]
+
+def group_lasts(values: np.ndarray, offsets: np.ndarray) -> np.ndarray:
+    return values[offsets[1:] - 1]
+
+def group_sums(values: np.ndarray, offsets: np.ndarray) -> np.ndarray:
+    return np.add.reduceat(values, offsets[:-1]) if len(values) else values[:0]
+
+def count_distinct(values: np.ndarray, offsets: np.ndarray) -> np.ndarray:
+    # Sort the (group, value) pairs, a pair that differs from the one before it is the first of a distinct value
+    group = np.repeat(np.arange(len(offsets) - 1), np.diff(offsets))
+    if values.dtype.kind in 'iu' and len(values) and values.min() >= 0:
+        # codes and ids: the pair fits one int64 key, which sorts much faster than the pairs
+        width = int(values.max()) + 1
+        pairs = np.sort(group * width + values.astype(np.int64))
+        is_first = np.ones(len(pairs), dtype=bool)
+        is_first[1:] = pairs[1:] != pairs[:-1]
+        group = pairs[is_first] // width
+    else:
+        order = np.lexsort((values, group))
+        values, group = values[order], group[order]
+        is_first = np.ones(len(values), dtype=bool)
+        is_first[1:] = (values[1:] != values[:-1]) | (group[1:] != group[:-1])
+        group = group[is_first]
+
+    return np.bincount(group, minlength=len(offsets) - 1)
+
+########################################## Count matrix ##############################################
+#
+# Number of rows for every (row key, column key) pair, e.g. transactions per buyer and NFT, as a sparse matrix in
+# CSR form: the non zero entries of matrix row r are columns[indptr[r]: indptr[r + 1]] with counts[...] at the same
+# positions. Row keys are numbered in order of first appearance and the entries of a row are in the order their
+# column key first appeared in it, which is the order a dict of counts per row would give.
+
+@dataclass
+class CountMatrix:
+    row_keys: np.ndarray
+    column_keys: np.ndarray
+    indptr: np.ndarray
+    columns: np.ndarray
+    counts: np.ndarray
+
+    def __len__(self) -> int:
+        return len(self.row_keys)
+
+    def row_sums(self) -> np.ndarray:
+        return np.add.reduceat(self.counts, self.indptr[:-1]) if len(self.counts) else self.counts[:0]
+
+    def row_nnz(self) -> np.ndarray:
+        return np.diff(self.indptr)
+
+    def row(self, r: int):
+        # column keys and counts of the non zero entries of row r
+        entries = slice(self.indptr[r], self.indptr[r + 1])
+        return self.column_keys[self.columns[entries]], self.counts[entries]
+
+def count_matrix(row_values: np.ndarray, column_values: np.ndarray) -> CountMatrix:
+    # One pass: number the rows, columns and distinct (row, column) pairs in order of first appearance, count the
+    # pairs, then order them by row while keeping the pairs of a row in order
+    rows, row_keys = pd.factorize(row_values)
+    columns, column_keys = pd.factorize(column_values)
+    width = max(len(column_keys), 1)
+
+    pairs, pair_keys = pd.factorize(rows.astype(np.int64) * width + columns)
+    counts = np.bincount(pairs, minlength=len(pair_keys))
+    pair_rows = pair_keys // width
+    order = np.argsort(pair_rows, kind='stable')
+
+    indptr = np.zeros(len(row_keys) + 1, dtype=np.int64)
+    np.cumsum(np.bincount(pair_rows, minlength=len(row_keys)), out=indptr[1:])
+
+    return CountMatrix(row_keys=np.asarray(row_keys), column_keys=np.asarray(column_keys), indptr=indptr,
+                       columns=(pair_keys % width)[order], counts=counts[order])
@@ -0,0 +1,59 @@
+# imports
+import pandas as pd
+import numpy as np
+from typing import Dict
+
+class Interner:
+    # Gives every distinct value (buyer address, NFT name, txn hash, ...) a dense int32 code in order of first
+    # appearance and keeps the reverse lookup table, so grouping, deduplication and sorting can work on small
+    # integers and the strings are only needed again for output. interner[codes] looks the values up
+    def __init__(self, values=()) -> None:
+        self.codes: Dict[object, int] = {}
+        self.values = np.empty(16, dtype=object)
+        self.size = 0
+
+        if len(values):
+            self.intern(values)
+
+    def __len__(self) -> int:
+        return self.size
+
+    def __getitem__(self, codes):
+        return self.values[:self.size][codes]
+
+    def __array__(self, dtype=None, copy=None) -> np.ndarray:
+        return self.values[:self.size].astype(dtype or object)
+
+    def append(self, values: np.ndarray) -> None:
+        # grow the lookup table geometrically so interning stays linear overall
+        if self.size + len(values) > len(self.values):
+            capacity = max(2 * len(self.values), self.size + len(values))
+            self.values = np.concatenate((self.values[:self.size], np.empty(capacity - self.size, dtype=object)))
+
+        self.codes.update(zip(values.tolist(), range(self.size, self.size + len(values))))
+        self.values[self.size: self.size + len(values)] = values
+        self.size += len(values)
+
+    def code(self, value) -> int:
+        code = self.codes.get(value)
+        if code is None:
+            code = self.size
+            self.append(np.array([value], dtype=object))
+
+        return code
+
+    def intern(self, values) -> np.ndarray:
+        # Factorize first so that every distinct value is only looked up once
+        if isinstance(getattr(values, 'dtype', None), pd.CategoricalDtype):
+            # categorical columns are factorized on their category codes, the strings are not compared at all
+            local_codes, uniques = pd.factorize(values)
+        else:
+            local_codes, uniques = pd.factorize(np.asarray(values, dtype=object))
+        uniques = np.asarray(uniques, dtype=object)
+
+        mapping = np.array([self.codes.get(value, -1) for value in uniques.tolist()], dtype=np.int32)
+        is_new = mapping < 0
+        mapping[is_new] = np.arange(self.size, self.size + is_new.sum(), dtype=np.int32)
+        self.append(uniques[is_new])
+
+        return mapping[local_codes]
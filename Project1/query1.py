@@ -1,11 +1,26 @@
 import pandas as pd 
 import numpy as np
-import glob
 import time
-from typing import Dict, List
+from typing import Dict, List, Optional
 from datetime import datetime
 import matplotlib.pyplot as plt
 import os
+import sys
+import argparse
+from transaction_table import TransactionTable
+from grouping import group_by, run_offsets, group_firsts, count_distinct, RowIndex, row_index
+from dataset import load_transactions, load_row_index
+from stream import stream_into, DEFAULT_CHUNKSIZE
+from sorting import sort_records, SORT_BACKENDS
+from sharding import main_sharded
+from ranking import top_k
+from aggregators import TxnCountAggregator
+
+# number of tokens to rank with --top, None ranks all of them
+top = None
+
+# backend of the ranking sort, see sorting.py
+sort_backend = 'radix'
 
 ##################################################### Data ###################################################
 from dataclasses import dataclass, field
@@ -15,188 +30,43 @@ class Query1Data:
     token_id: int
     n_txns: int
 
-@dataclass(order=True)
-class NFTTransaction:
-    txn_hash: str
-    time_stamp: str
-    date_time: str
-    action: str
-    buyer: str
-    nft: str
-    token_id: int
-    type_: int
-    quantity: int
-    price: float
-    price_str: str
-    market: str
-    n_unique_buyers: int
-
-#################################################### Radix sort ##############################################
-
-def counting_sort_by_n_txns(A: List[Query1Data], exp) -> List[Query1Data]:
-    n = len(A)
- 
-    # The output array elements that will have sorted arr
-    output = [0] * (n)
- 
-    # initialize count array as 0
-    count = [0] * (10)
- 
-    # Store count of occurrences in count[]
-    for i in range(0, n):
-        index = int(A[i].n_txns) // exp
-        index = int(index)
-
-        count[index % 10] += 1
- 
-    # Change count[i] so that count[i] now contains actual
-    # position of this digit in output array
-    for i in range(1, 10):
-        count[i] += count[i - 1]
- 
-    # Build the output array
-    i = n - 1
-    while i >= 0:
-        index = int(A[i].n_txns) // exp
-        index = int(index)
-
-        output[count[index % 10] - 1] = A[i]
-        count[index % 10] -= 1
-        i -= 1
- 
-    return output
- 
-# Method to do Radix Sort
-def radix_sort_by_n_txns(A: List[Query1Data]) -> List[Query1Data]:
-    # Find the maximum number to know number of digits
-    max1 = max_by_n_txns(A)
- 
-    # Do counting sort for every digit. Note that instead
-    # of passing digit number, exp is passed. exp is 10^i
-    # where i is current digit number
-    exp = 1
-    while max1 / exp >= 1:
-        A = counting_sort_by_n_txns(A, exp)
-        exp *= 10
-
-    B = []
-    n = len(A)
-    for i in range(n):
-        B.append(A[n - i - 1])
-
-    return B
 
-def max_by_n_txns(A: List[Query1Data]) -> List[Query1Data]:
-    max = 0
-    for value in A:
-        n_txns = int(value.n_txns)
-        if  n_txns > max:
-            max = n_txns
+#################################################### Sorting ##############################################
 
-    return max
+def sort_by_n_txns(A: List[Query1Data]) -> List[Query1Data]:
+    # descending by the numbers of transactions, equal ones latest first, with the sort backend chosen by --sort
+    return sort_records(A, key=lambda row: row.n_txns, descending=True, latest_first=True, backend=sort_backend)
 
 ########################################## Utils #####################################################
 
-def get_all_transactions(data: List[NFTTransaction]):
-    hash = {}
+def save_result(data: List[Query1Data], transactions: Optional[TransactionTable], elapsed_time, index: Optional[RowIndex] = None):
+    all_txns = None
+    if transactions is not None:
+        # the rows of every token, from the index of the dataset when the caller has loaded it
+        all_txns = index if index is not None else row_index(transactions.token_id)
 
-    for row in data:
-        if row.token_id in hash:
-            hash[row.token_id].append(row)
-        else:
-            hash[row.token_id] = [row]
-
-    return hash
-
-def save_result(data: List[Query1Data], all_txns, elapsed_time):
-    all_txns = get_all_transactions(all_txns)
+    # the records of the rows that are written are built at once, column by column
+    records = None
+    if all_txns is not None:
+        rows = np.concatenate([all_txns[row.token_id] for row in data]) if data else np.zeros(0, dtype=np.int64)
+        records = dict(zip(rows.tolist(), transactions.rows(rows)))
 
     with open(output_path + "/query1_out.txt", "w") as file:
         file.writelines(f"The execution time is {elapsed_time} nano secs\n\n")
         for row in data:
             file.writelines(f"{row.token_id} (frequency = {row.n_txns})\n")
+            # only the per group results are known in streaming mode
+            if all_txns is None:
+                continue
+
             file.writelines("Token ID,\t Txn hash,\t Date Time (UTC),\t Buyer,\t NFT,\t Type,\t Quantity,\t Price (USD)\n")
             file.writelines("\n")
-            for value in all_txns[row.token_id]:
+            for i in all_txns[row.token_id]:
+                value = records[i]
                 file.writelines(f"{value.token_id},\t {value.txn_hash},\t {value.date_time},\t {value.buyer},\t {value.nft},\t {value.type_},\t {value.quantity},\t {value.price}\n")
 
             file.writelines("\n\n")
 
-def currency_converter(data: List[NFTTransaction]) -> List[NFTTransaction]:
-  for row in data:
-    price = row.price_str
-
-    if type(price) is not str:
-      row.price = float(float(price) * 1.00)
-      continue
-
-    try:
-      price, currency, _ = price.split(" ")
-      price = price.replace(",", "")
-
-      if currency == "ETH":
-        row.price = float(float(price) * 1309.97)
-      
-      elif currency == "WETH":
-        row.price = float(float(price) * 1322.16)
-
-      elif currency == "ASH":
-        row.price = float(float(price) * 0.9406)
-      
-      elif currency == "GALA":
-        row.price = float(float(price) * 0.03748)
-        
-      elif currency == "TATR":
-        row.price = float(float(price) * 0.012056)
-        
-      elif currency == "USDC":
-        row.price = float(float(price) * 1.00)
-        
-      elif currency == "MANA":
-        row.price = float(float(price) * 0.64205)
-        
-      elif currency == "SAND":
-        row.price = float(float(price) * 0.7919)
-        
-      elif currency == "RARI":
-        row.price = float(float(price) * 2.18)
-        
-      elif currency == "CTZN":
-        row.price = float(float(price) * 0.00321)
-        
-      elif currency == "APE":
-        row.price = float(float(price) * 4.62)
-
-      else:
-        row.price = float(float(price) * 1.00)
-
-    except ValueError:
-      None
-      
-  return data
-
-def prepare_data(data) -> List[NFTTransaction]:
-  data = data.reset_index()  # make sure indexes pair with number of rows
-
-  transactions = []
-  for i, row in data.iterrows():
-    transactions.append(NFTTransaction(
-        txn_hash=row['Txn Hash'], 
-        time_stamp=row['UnixTimestamp'],
-        date_time=row['Date Time (UTC)'],
-        action=row['Action'],
-        buyer=row['Buyer'],
-        nft=row['NFT'],
-        token_id=row['Token ID'],
-        type_=row['Type'],
-        quantity=row['Quantity'],
-        price_str=row['Price'],
-        price=0.0,
-        market=row['Market'],
-        n_unique_buyers=0))
-    
-  return transactions
-
 def get_dataframe(data: List[Query1Data]):
   txns_list = []
 
@@ -210,32 +80,14 @@ def get_dataframe(data: List[Query1Data]):
   df = pd.DataFrame.from_records(txns_list)
   return df
 
-def update_with_n_txns(sorted_txns: List[NFTTransaction]) -> List[Query1Data]:
-  # Lets sort the token ids by the number of unique buyers
-  unique_count = 0
-  unique_txn_hash = []
-  n = len(sorted_txns)
-
-  new_txns = []
-  
-  for i, row in enumerate(sorted_txns):
-      if row.txn_hash not in unique_txn_hash:
-          unique_count += 1
-          unique_txn_hash.append(row.txn_hash)
-
-      # This is for the scenario when the transaction is the last in the array (spreadsheet)
-      if i == n - 1:
-          data = Query1Data(token_id=sorted_txns[i].token_id, n_txns=unique_count)
-          new_txns.append(data)
-
-      elif sorted_txns[i].token_id != sorted_txns[i+1].token_id:
-          data = Query1Data(token_id=sorted_txns[i].token_id, n_txns=unique_count)
-          new_txns.append(data)
+def update_with_n_txns(sorted_txns: TransactionTable, offsets: Optional[np.ndarray] = None) -> List[Query1Data]:
+  # The transactions are grouped by token, count the unique txn hashes of every group in one pass
+  # offsets of the token groups, found from the runs of the tokens unless the caller has them
+  offsets = offsets if offsets is not None else run_offsets(sorted_txns.token_id)
+  token_ids = group_firsts(sorted_txns.token_id, offsets).tolist()
+  n_txns = count_distinct(sorted_txns.txn_hash, offsets).tolist()
 
-          unique_count = 0
-          unique_txn_hash = []
-
-  return new_txns
+  return [Query1Data(token_id=token_id, n_txns=count) for token_id, count in zip(token_ids, n_txns)]
 
 def plot_graph(asymptotic_runtimes, actual_runtimes, filename="query_1.png", rows=92):
     x_axis = [i for i in range(rows+1)]
@@ -253,31 +105,25 @@ def plot_graph(asymptotic_runtimes, actual_runtimes, filename="query_1.png", row
 ############################################ Main Program ######################################################
 
 def main():
-    # getting all the input files
-    files = glob.glob(root_path + "/*.csv")
-    # Read all the files placed in the current wokring directory with csv extenion
-    data = [pd.read_csv(f) for f in files]
-    data = pd.concat(data, ignore_index=True)
-    # drop all null records
-    data = data.dropna()
-    # drop all duplicate records
-    data = data.drop_duplicates()
-
-    # prepare data accordingly as per data types and get required columns
-    transactions = prepare_data(data)
-    transactions = currency_converter(transactions)
+    # load the cleaned transactions, from the cache when the input files have not changed
+    transactions = load_transactions(root_path)
+    # the rows of every token for saving the results, built once per dataset
+    index = load_row_index(root_path, transactions, 'token_id')
 
     elapsed_time_averages = []
     asymptotic_times = []
     rows = int(len(transactions) / 1000)
     # Run the sorting in batches of 1000, 2000, 3000, ......
+    # The per group state is kept across the batches, every batch only folds in the rows it adds
+    aggregator = TxnCountAggregator()
     for i in range(rows + 1):
         print(f"{(i + 1) * 1000} transactions")
 
         n = (i + 1) * 1000
 
         # run the query for a specified number of runs
-        aveg_elapsed_time_ns = run_n_times(transactions[0: n], no_of_runs, save= i == rows)
+        aggregator.update(transactions[n - 1000: n])
+        aveg_elapsed_time_ns = run_n_times(transactions[0: n], no_of_runs, save= i == rows, data=aggregated_data(aggregator), index=index)
         elapsed_time_averages.append(aveg_elapsed_time_ns)
 
         # this is used to ensure both the asymptotic and actual run time have the same scale while plotting the graph
@@ -288,10 +134,30 @@ def main():
 
     plot_graph(asymptotic_runtimes=asymptotic_times, actual_runtimes=elapsed_time_averages,filename=output_path+"/query_1.png", rows=rows)
 
-def run_n_times(transactions, n, save=False):
+def main_stream(chunksize):
+    # Read the csv files a chunk at a time and only keep the per token state, for datasets that do not fit in memory
+    aggregator = TxnCountAggregator()
+    n = stream_into(root_path, [aggregator], chunksize)
+    print(f"{n} transactions")
+
+    data = aggregated_data(aggregator)
+
+    # collect start time
+    start_time = time.time_ns()
+    sorted_txns = sort_data(data)
+    # collect end time
+    end_time = time.time_ns()
+
+    elapsed_time = (end_time - start_time)
+    print(f"\nThe elapsed time is {elapsed_time} nano secs (i.e {elapsed_time/1e9} secs)\n")
+
+    # the transactions themselves are not kept, so only the per token results are saved
+    save_result(sorted_txns, None, elapsed_time)
+
+def run_n_times(transactions, n, data, save=False, index=None):
     elapsed_times = []
     for i in range(n):
-        elapsed_time, sorted_txns = run_query(transactions, save=save)
+        elapsed_time, sorted_txns = run_query(transactions, save=save, data=data, index=index)
         elapsed_times.append(elapsed_time)
 
     aveg_elapsed_time_ns = sum(elapsed_times)/len(elapsed_times)
@@ -300,48 +166,61 @@ def run_n_times(transactions, n, save=False):
 
     return aveg_elapsed_time_ns
 
-def run_query(transactions, save=False):
-    data = process_data(transactions)
+def run_query(transactions, data, save=False, index=None):
+    # data is the aggregated transactions, kept up to date incrementally by the caller, the sort gets its own copy
+    data = list(data)
 
     # collect start time
     start_time = time.time_ns()
-    # sort the data using radix sort
-    sorted_txns = radix_sort_by_n_txns(data)
+    # sort the data with the chosen sort backend
+    sorted_txns = sort_data(data)
     # collect end time
     end_time = time.time_ns()
 
     elapsed_time = (end_time - start_time)
 
     if save:
-        save_result(sorted_txns, transactions, elapsed_time)
+        save_result(sorted_txns, transactions, elapsed_time, index)
 
     return elapsed_time, sorted_txns
 
-def process_data(A: List[NFTTransaction]) -> List[Query1Data]:
-    hash = {}
-    for row in A:
-        if row.token_id in hash:
-            hash[row.token_id].append(row)
-        else:
-            hash[row.token_id] = [row]
-        
-    transactions = []
-    for key in hash:
-        transactions = np.concatenate((transactions, hash[key]))
-
-    A = update_with_n_txns(transactions)
+def aggregated_data(aggregator: TxnCountAggregator) -> List[Query1Data]:
+    return [Query1Data(token_id=token_id, n_txns=n_txns) for token_id, n_txns in aggregator.results()]
+
+def sort_data(data: List[Query1Data]) -> List[Query1Data]:
+    # only the top tokens with --top, else sort all of them
+    if top is not None:
+        return top_k(data, top, key=lambda row: row.n_txns)
+    return sort_by_n_txns(data)
+
+def process_data(A: TransactionTable, index: Optional[RowIndex] = None) -> List[Query1Data]:
+    # rows grouped by token id, the groups in order of first appearance. The row index of the dataset has that
+    # grouping already, only a table without one is grouped here
+    if index is not None:
+        return update_with_n_txns(A[index.order], index.offsets)
+
+    rows = group_by(A.token_id).order
+
+    A = update_with_n_txns(A[rows])
     return A
 
 if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--stream", action="store_true", help="read the csv files in chunks instead of all at once")
+    parser.add_argument("--chunksize", type=int, default=DEFAULT_CHUNKSIZE, help="rows per chunk in streaming mode")
+    parser.add_argument("--sort", choices=list(SORT_BACKENDS), default=sort_backend, help="backend of the ranking sort")
+    parser.add_argument("--workers", type=int, default=None, help="aggregate hash shards of the transactions in this many processes")
+    parser.add_argument("--top", type=int, default=None, metavar="K", help="only rank and save the K largest groups")
+    args = parser.parse_args()
+
+    sort_backend = args.sort
+
+    top = args.top
+
     # declare root path
     global root_path
     root_path = os.getcwd()
 
-    print("Kindly specify the number of runs needed (suggested runs is 1), Example : 1")
-    # No of times the script need to be run
-    global no_of_runs
-    no_of_runs = int(input())
-
     # Output path to store results
     global output_path
     output_path = root_path + "/output"
@@ -349,4 +228,14 @@ if __name__ == "__main__":
     if not os.path.isdir(output_path):
         os.mkdir(output_path)
 
-    main()
\ No newline at end of file
+    if args.stream:
+        main_stream(args.chunksize)
+    elif args.workers:
+        main_sharded(sys.modules[__name__], process_data, 'token_id', root_path, args.workers)
+    else:
+        print("Kindly specify the number of runs needed (suggested runs is 1), Example : 1")
+        # No of times the script need to be run
+        global no_of_runs
+        no_of_runs = int(input())
+
+        main()
@@ -1,13 +1,24 @@
 #imports
-from typing import List
+from typing import List, Optional
 import pandas as pd 
 import numpy as np
-import glob
 
 import matplotlib.pyplot as plt
 import time
 from dataclasses import dataclass, field
 import os
+import sys
+import argparse
+from transaction_table import TransactionTable
+from grouping import group_by, run_offsets, group_firsts, RowIndex, row_index
+from dataset import load_transactions, load_row_index
+from stream import stream_into, DEFAULT_CHUNKSIZE
+from sorting import sort_records, SORT_BACKENDS
+from sharding import main_sharded
+from aggregators import AveragePriceAggregator
+
+# backend of the ranking sort, see sorting.py
+sort_backend = 'merge'
 
 ##################################################### Data ###################################################
 
@@ -16,76 +27,35 @@ class Query2Data:
     token_id: int
     avg: float
 
-@dataclass(order=True)
-class NFTTransaction:
-    txn_hash: str
-    time_stamp: str
-    date_time: str
-    action: str
-    buyer: str
-    nft: str
-    token_id: int
-    type_: int
-    quantity: int
-    price: float
-    price_str: str
-    market: str
-
-def merge_sort(A: List[Query2Data]):
-    if len(A) == 1:
-        return A
-
-    q = int(len(A)/2)
-    B = A[:q]
-    C = A[q:]
-
-    L = merge_sort(B)
-    R = merge_sort(C)
-    return merge_by_ntxn(L, R)
-
-def merge_by_ntxn(L: List[Query2Data], R: List[Query2Data]):
-    n = len(L) + len(R)
-    i = j = 0
-    B = []
-    for k in range(0, n):
-        if j >= len(R) or (i < len(L) and L[i].avg >= R[j].avg):
-            B.append(L[i])
-            i = i + 1
-        else:
-            B.append(R[j])
-            j = j + 1
-
-    return B
 
+#################################################### Sorting ##############################################
+
+def sort_by_avg(A: List[Query2Data]) -> List[Query2Data]:
+    # descending by the average prices, equal ones in their input order, with the sort backend chosen by --sort
+    return sort_records(A, key=lambda row: row.avg, descending=True, backend=sort_backend)
 
 ############################################ Main Program ######################################################
 
 def main():
-    # getting all the input files
-    files = glob.glob(root_path + "/*.csv")
-    # Read all the files placed in the current wokring directory with csv extenion
-    data = [pd.read_csv(f) for f in files]
-    data = pd.concat(data, ignore_index=True)
-    # drop all null records
-    data = data.dropna()
-    # drop all duplicate records
-    data = data.drop_duplicates()
-
-    # prepare data accordingly as per data types and get required columns
-    transactions = prepare_data(data)
-    transactions = currency_converter(transactions)
+    # load the cleaned transactions, from the cache when the input files have not changed
+    transactions = load_transactions(root_path)
+    # the rows of every token for saving the results, built once per dataset
+    index = load_row_index(root_path, transactions, 'token_id')
 
     elapsed_time_averages = []
     asymptotic_times = []
     rows = int(len(transactions) / 1000)
     # Run the sorting in batches of 1000, 2000, 3000, ......
+    # The per group state is kept across the batches, every batch only folds in the rows it adds
+    aggregator = AveragePriceAggregator()
     for i in range(rows + 1):
         print(f"{(i + 1) * 1000} transactions")
 
         n = (i + 1) * 1000
 
         # run the query for a specified number of runs
-        aveg_elapsed_time_ns = run_n_times(transactions[0: n], no_of_runs, save= i == rows)
+        aggregator.update(transactions[n - 1000: n])
+        aveg_elapsed_time_ns = run_n_times(transactions[0: n], no_of_runs, save= i == rows, data=aggregated_data(aggregator), index=index)
         elapsed_time_averages.append(aveg_elapsed_time_ns)
 
         # this is used to ensure both the asymptotic and actual run time have the same scale while plotting the graph
@@ -99,10 +69,30 @@ def main():
 
     # run_query(transactions, save=True)
 
-def run_n_times(transactions, n, save=False):
+def main_stream(chunksize):
+    # Read the csv files a chunk at a time and only keep the per token state, for datasets that do not fit in memory
+    aggregator = AveragePriceAggregator()
+    n = stream_into(root_path, [aggregator], chunksize)
+    print(f"{n} transactions")
+
+    data = aggregated_data(aggregator)
+
+    # collect start time
+    start_time = time.time_ns()
+    sorted_txns = sort_data(data)
+    # collect end time
+    end_time = time.time_ns()
+
+    elapsed_time = (end_time - start_time)
+    print(f"\nThe elapsed time is {elapsed_time} nano secs (i.e {elapsed_time/1e9} secs)\n")
+
+    # the transactions themselves are not kept, so only the per token results are saved
+    save_result(sorted_txns, None, elapsed_time)
+
+def run_n_times(transactions, n, data, save=False, index=None):
     elapsed_times = []
     for i in range(n):
-        elapsed_time, sorted_txns = run_query(transactions, run=i+1, save=save)
+        elapsed_time, sorted_txns = run_query(transactions, run=i+1, save=save, data=data, index=index)
         elapsed_times.append(elapsed_time)
 
     aveg_elapsed_time_ns = sum(elapsed_times)/len(elapsed_times)
@@ -111,14 +101,15 @@ def run_n_times(transactions, n, save=False):
 
     return aveg_elapsed_time_ns
 
-def run_query(transactions, run=1, save=False):
-    data = process_data(transactions)
+def run_query(transactions, data, run=1, save=False, index=None):
+    # data is the aggregated transactions, kept up to date incrementally by the caller, the sort gets its own copy
+    data = list(data)
 
     # collect start_time
     start_time = time.time_ns()
-    # sort using merge sort algorithm
+    # sort using the chosen sort backend
     # merge_sort(sorted_txns, 0, len(sorted_txns)-1)
-    sorted_txns = merge_sort(data)
+    sorted_txns = sort_by_avg(data)
     # collect end_time
     end_time = time.time_ns()
 
@@ -126,135 +117,71 @@ def run_query(transactions, run=1, save=False):
     elapsed_time = end_time - start_time
 
     if save:
-        save_result(sorted_txns, transactions, elapsed_time)
+        save_result(sorted_txns, transactions, elapsed_time, index)
         
     return elapsed_time, sorted_txns
 
 ########################################## Utils #####################################################
-def process_data(transactions):
-  hash = {}
+def aggregated_data(aggregator: AveragePriceAggregator) -> List[Query2Data]:
+  return [Query2Data(token_id=token_id, avg=avg) for token_id, avg in aggregator.results()]
 
-  for item in transactions:
-    if item.token_id in hash:
-      hash[item.token_id].append(item)
-    else:
-      hash[item.token_id] = [item]
-  
-  new_transactions = []
-  for key in hash:
-    cur = hash[key]
-    sum = 0
-    count = 0
-    for item in cur:
-      sum = sum + (float(item.price) * float(item.quantity))
-      count = count + item.quantity
-    
-    avg = sum / count
-    
-    new_transactions.append(Query2Data(token_id=key, avg=avg))  
-
-  return new_transactions
-
-def get_all_transactions(data: List[NFTTransaction]):
-    hash = {}
-
-    for row in data:
-        if row.token_id in hash:
-            hash[row.token_id].append(row)
-        else:
-            hash[row.token_id] = [row]
-
-    return hash
-
-def save_result(data: List[Query2Data], all_txns, elapsed_time):
-    all_txns = get_all_transactions(all_txns)
+def sort_data(data: List[Query2Data]) -> List[Query2Data]:
+  # sort using the chosen sort backend
+  return sort_by_avg(data)
+
+def update_with_avg(sorted_txns: TransactionTable, offsets: Optional[np.ndarray] = None) -> List[Query2Data]:
+  # The transactions are grouped by token, the price * quantity and quantity totals of all the groups are summed at
+  # once with bincount, which adds up every token's rows in their order
+  # offsets of the token groups, found from the runs of the tokens unless the caller has them
+  offsets = offsets if offsets is not None else run_offsets(sorted_txns.token_id)
+  n_groups = len(offsets) - 1
+  groups = np.repeat(np.arange(n_groups), np.diff(offsets))
+  totals = np.bincount(groups, weights=sorted_txns.price * sorted_txns.quantity, minlength=n_groups)
+  counts = np.bincount(groups, weights=sorted_txns.quantity, minlength=n_groups)
+
+  # a token whose quantities add up to 0 has no average price, it is given 0
+  avgs = np.divide(totals, counts, out=np.zeros(n_groups), where=counts != 0)
+  token_ids = group_firsts(sorted_txns.token_id, offsets).tolist()
+
+  return [Query2Data(token_id=token_id, avg=avg) for token_id, avg in zip(token_ids, avgs.tolist())]
+
+def process_data(A: TransactionTable, index: Optional[RowIndex] = None) -> List[Query2Data]:
+  # rows grouped by token id, the groups in order of first appearance. The row index of the dataset has that
+  # grouping already, only a table without one is grouped here
+  if index is not None:
+    return update_with_avg(A[index.order], index.offsets)
+
+  rows = group_by(A.token_id).order
+
+  A = update_with_avg(A[rows])
+  return A
+
+def save_result(data: List[Query2Data], transactions: Optional[TransactionTable], elapsed_time, index: Optional[RowIndex] = None):
+    all_txns = None
+    if transactions is not None:
+        # the rows of every token, from the index of the dataset when the caller has loaded it
+        all_txns = index if index is not None else row_index(transactions.token_id)
+
+    # the records of all the rows are built at once, column by column
+    records = transactions.rows() if transactions is not None else None
 
     with open(output_path + "/query2_out.txt", "w") as file:
         file.writelines(f"The execution time is {elapsed_time} nano secs\n\n")
 
         for row in data:
             file.writelines(f"{row.token_id} (average = {row.avg})\n")
+            # only the per group results are known in streaming mode
+            if all_txns is None:
+                continue
+
             file.writelines("Token ID,\t Txn hash,\t Date Time (UTC),\t Buyer,\t NFT,\t Type,\t Quantity,\t Price (USD)\n")
             file.writelines("\n")
-            for value in all_txns[row.token_id]:
+            for i in all_txns[row.token_id]:
+                value = records[i]
                 file.writelines(f"{value.token_id},\t\t {value.txn_hash},\t {value.date_time},\t {value.buyer},\t {value.nft},\t {value.type_},\t {value.quantity},\t {value.price}\n")
 
             file.writelines("\n\n")
 
-def currency_converter(data: List[NFTTransaction]) -> List[NFTTransaction]:
-  for row in data:
-    price = row.price_str
-
-    if type(price) is not str:
-      row.price = float(float(price) * 1.00)
-      continue
-
-    try:
-      price, currency, _ = price.split(" ")
-      price = price.replace(",", "")
-
-      if currency == "ETH":
-        row.price = float(float(price) * 1309.97)
-      
-      elif currency == "WETH":
-        row.price = float(float(price) * 1322.16)
-
-      elif currency == "ASH":
-        row.price = float(float(price) * 0.9406)
-      
-      elif currency == "GALA":
-        row.price = float(float(price) * 0.03748)
-        
-      elif currency == "TATR":
-        row.price = float(float(price) * 0.012056)
-        
-      elif currency == "USDC":
-        row.price = float(float(price) * 1.00)
-        
-      elif currency == "MANA":
-        row.price = float(float(price) * 0.64205)
-        
-      elif currency == "SAND":
-        row.price = float(float(price) * 0.7919)
-        
-      elif currency == "RARI":
-        row.price = float(float(price) * 2.18)
-        
-      elif currency == "CTZN":
-        row.price = float(float(price) * 0.00321)
-        
-      elif currency == "APE":
-        row.price = float(float(price) * 4.62)
-
-      else:
-        row.price = float(float(price) * 1.00)
-
-    except ValueError:
-      None
-      
-  return data
-
-def prepare_data(data) -> List[NFTTransaction]:
-  data = data.reset_index()  # make sure indexes pair with number of rows
-
-  transactions = []
-  for i, row in data.iterrows():
-    transactions.append(NFTTransaction(
-        txn_hash=row['Txn Hash'], 
-        time_stamp=row['UnixTimestamp'],
-        date_time=row['Date Time (UTC)'],
-        action=row['Action'],
-        buyer=row['Buyer'],
-        nft=row['NFT'],
-        token_id=row['Token ID'],
-        type_=row['Type'],
-        quantity=row['Quantity'],
-        price_str=row['Price'],
-        price=0.0,
-        market=row['Market']))
-    
-  return transactions
-
 def get_dataframe(data: List[Query2Data]):
   txns_list = []
 
@@ -284,15 +211,19 @@ def plot_graph(asymptotic_runtimes, actual_runtimes, filename="query_2.png", row
 
 
 if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--stream", action="store_true", help="read the csv files in chunks instead of all at once")
+    parser.add_argument("--chunksize", type=int, default=DEFAULT_CHUNKSIZE, help="rows per chunk in streaming mode")
+    parser.add_argument("--sort", choices=list(SORT_BACKENDS), default=sort_backend, help="backend of the ranking sort")
+    parser.add_argument("--workers", type=int, default=None, help="aggregate hash shards of the transactions in this many processes")
+    args = parser.parse_args()
+
+    sort_backend = args.sort
+
     # declare root path
     global root_path
     root_path = os.getcwd()
 
-    print("Kindly specify the number of runs needed (suggested runs is 1), Example : 1")
-    # No of times the script need to be run
-    global no_of_runs
-    no_of_runs = int(input())
-
     # Output path to store results
     global output_path
     output_path = root_path + "/output"
@@ -300,4 +231,14 @@ if __name__ == "__main__":
     if not os.path.isdir(output_path):
         os.mkdir(output_path)
 
-    main()
+    if args.stream:
+        main_stream(args.chunksize)
+    elif args.workers:
+        main_sharded(sys.modules[__name__], process_data, 'token_id', root_path, args.workers)
+    else:
+        print("Kindly specify the number of runs needed (suggested runs is 1), Example : 1")
+        # No of times the script need to be run
+        global no_of_runs
+        no_of_runs = int(input())
+
+        main()
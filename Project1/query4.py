@@ -1,11 +1,31 @@
 #imports
 import pandas as pd
 import numpy as np
-from typing import List
+from typing import List, Optional
 import matplotlib.pyplot as plt 
 import time
-import glob
 import os
+import sys
+import argparse
+from functools import partial
+from transaction_table import TransactionTable
+from grouping import group_by, run_offsets, group_firsts, count_distinct, RowIndex, row_index
+from dataset import load_transactions, load_row_index
+from stream import stream_into, DEFAULT_CHUNKSIZE
+from sorting import sort_records, SORT_BACKENDS
+from sharding import main_sharded, aggregate_with
+from ranking import top_k
+from aggregators import UniqueBuyerAggregator, ApproximateUniqueBuyerAggregator
+from sketch import error_bound
+
+# error bound of the approximate distinct counts, set with --approximate. None counts them exactly
+approximate_error = None
+
+# number of tokens to rank with --top, None ranks all of them
+top = None
+
+# backend of the ranking sort, see sorting.py
+sort_backend = 'radix'
 
 ##################################################### Data ###################################################
 from dataclasses import dataclass
@@ -15,6 +35,8 @@ class Query4Data:
     token_id: str
     # buyer: str
     n_unique_buyers: int
+    # standard error of n_unique_buyers when it is approximate
+    error: Optional[float] = None
 
 
 @dataclass(order=True)
@@ -23,190 +45,45 @@ class Query4Input:
     token_id: int
     buyer: str
 
-@dataclass(order=True)
-class NFTTransaction:
-    txn_hash: str
-    time_stamp: str
-    date_time: str
-    action: str
-    buyer: str
-    nft: str
-    token_id: int
-    type_: int
-    quantity: int
-    price: float
-    price_str: str
-    market: str
-    n_unique_buyers: int
-
-#################################################### Radix sort ##############################################
-
-def counting_sort_by_nbuyer(A: List[Query4Data], exp) -> List[Query4Data]:
-    n = len(A)
- 
-    # The output array elements that will have sorted arr
-    output = [0] * (n)
- 
-    # initialize count array as 0
-    count = [0] * (10)
- 
-    # Store count of occurrences in count[]
-    for i in range(0, n):
-        index = int(A[i].n_unique_buyers) // exp
-        index = int(index)
-
-        count[index % 10] += 1
- 
-    # Change count[i] so that count[i] now contains actual
-    # position of this digit in output array
-    for i in range(1, 10):
-        count[i] += count[i - 1]
- 
-    # Build the output array
-    i = n - 1
-    while i >= 0:
-        index = int(A[i].n_unique_buyers) // exp
-        index = int(index)
-
-        output[count[index % 10] - 1] = A[i]
-        count[index % 10] -= 1
-        i -= 1
- 
-    return output
- 
-# Method to do Radix Sort
-def radix_sort_by_nbuyer(A: List[Query4Data]) -> List[Query4Data]:
-    # Find the maximum number to know number of digits
-    max1 = max_by_nbuyer(A)
- 
-    # Do counting sort for every digit. Note that instead
-    # of passing digit number, exp is passed. exp is 10^i
-    # where i is current digit number
-    exp = 1
-    while max1 / exp >= 1:
-        A = counting_sort_by_nbuyer(A, exp)
-        exp *= 10
-
-    B = []
-    n = len(A)
-    for i in range(n):
-        B.append(A[n - i - 1])
-
-    return B
-
-def max_by_nbuyer(A: List[Query4Data]) -> List[Query4Data]:
-    max = 0
-    for value in A:
-        n_unique_buyers = int(value.n_unique_buyers)
-        if  n_unique_buyers > max:
-            max = n_unique_buyers
+#################################################### Sorting ##############################################
 
-    return max
+def sort_by_nbuyer(A: List[Query4Data]) -> List[Query4Data]:
+    # descending by the numbers of unique buyers, equal ones latest first, with the sort backend chosen by --sort
+    return sort_records(A, key=lambda row: row.n_unique_buyers, descending=True, latest_first=True, backend=sort_backend)
 
 ########################################## Utils #####################################################
 
-def get_all_transactions(data: List[NFTTransaction]):
-    hash = {}
+def save_result(data: List[Query4Data], transactions: Optional[TransactionTable], elapsed_time, index: Optional[RowIndex] = None):
+    all_txns = None
+    if transactions is not None:
+        # the rows of every token, from the index of the dataset when the caller has loaded it
+        all_txns = index if index is not None else row_index(transactions.token_id)
 
-    for row in data:
-        if row.token_id in hash:
-            hash[row.token_id].append(row)
-        else:
-            hash[row.token_id] = [row]
-
-    return hash
-
-def save_result(data: List[Query4Data], all_txns, elapsed_time):
-    all_txns = get_all_transactions(all_txns)
+    # the records of the rows that are written are built at once, column by column
+    records = None
+    if all_txns is not None:
+        rows = np.concatenate([all_txns[row.token_id] for row in data]) if data else np.zeros(0, dtype=np.int64)
+        records = dict(zip(rows.tolist(), transactions.rows(rows)))
 
     with open(output_path + "/query4_out.txt", "w") as file:
 
         file.writelines(f"The execution time is {elapsed_time} nano secs\n\n")
 
         for row in data:
-            file.writelines(f"{row.token_id} (frequency = {row.n_unique_buyers})\n")
+            frequency = f"{row.n_unique_buyers}" if row.error is None else f"{row.n_unique_buyers} ± {row.error:.1f}"
+            file.writelines(f"{row.token_id} (frequency = {frequency})\n")
+            # only the per group results are known in streaming mode
+            if all_txns is None:
+                continue
+
             file.writelines("Token ID,\t Txn hash,\t Date Time (UTC),\t Buyer,\t NFT,\t Type,\t Quantity,\t Price (USD)\n")
             file.writelines("\n")
-            for value in all_txns[row.token_id]:
+            for i in all_txns[row.token_id]:
+                value = records[i]
                 file.writelines(f"{value.token_id},\t\t {value.txn_hash},\t {value.date_time},\t {value.buyer},\t {value.nft},\t {value.type_},\t {value.quantity},\t {value.price}\n")
 
             file.writelines("\n\n")
 
-def currency_converter(data: List[NFTTransaction]) -> List[NFTTransaction]:
-  for row in data:
-    price = row.price_str
-
-    if type(price) is not str:
-      row.price = float(float(price) * 1.00)
-      continue
-
-    try:
-      price, currency, _ = price.split(" ")
-      price = price.replace(",", "")
-
-      if currency == "ETH":
-        row.price = float(float(price) * 1309.97)
-      
-      elif currency == "WETH":
-        row.price = float(float(price) * 1322.16)
-
-      elif currency == "ASH":
-        row.price = float(float(price) * 0.9406)
-      
-      elif currency == "GALA":
-        row.price = float(float(price) * 0.03748)
-        
-      elif currency == "TATR":
-        row.price = float(float(price) * 0.012056)
-        
-      elif currency == "USDC":
-        row.price = float(float(price) * 1.00)
-        
-      elif currency == "MANA":
-        row.price = float(float(price) * 0.64205)
-        
-      elif currency == "SAND":
-        row.price = float(float(price) * 0.7919)
-        
-      elif currency == "RARI":
-        row.price = float(float(price) * 2.18)
-        
-      elif currency == "CTZN":
-        row.price = float(float(price) * 0.00321)
-        
-      elif currency == "APE":
-        row.price = float(float(price) * 4.62)
-
-      else:
-        row.price = float(float(price) * 1.00)
-
-    except ValueError:
-      None
-      
-  return data
-
-def prepare_data(data) -> List[NFTTransaction]:
-  data = data.reset_index()  # make sure indexes pair with number of rows
-
-  transactions = []
-  for i, row in data.iterrows():
-    transactions.append(NFTTransaction(
-        txn_hash=row['Txn Hash'], 
-        time_stamp=row['UnixTimestamp'],
-        date_time=row['Date Time (UTC)'],
-        action=row['Action'],
-        buyer=row['Buyer'],
-        nft=row['NFT'],
-        token_id=row['Token ID'],
-        type_=row['Type'],
-        quantity=row['Quantity'],
-        price_str=row['Price'],
-        price=0.0,
-        market=row['Market'],
-        n_unique_buyers=0))
-    
-  return transactions
-
 def get_dataframe(data: List[Query4Data]):
   txns_list = []
 
@@ -220,32 +97,14 @@ def get_dataframe(data: List[Query4Data]):
   df = pd.DataFrame.from_records(txns_list)
   return df
 
-def update_with_n_unique_buyers(sorted_txns: List[Query4Input]) -> List[Query4Data]:
-  # Lets sort the token ids by the number of unique buyers
-  unique_count = 0
-  unique_buyers = []
-  n = len(sorted_txns)
-
-  new_txns = []
-  
-  for i, row in enumerate(sorted_txns):
-      if row.buyer not in unique_buyers:
-          unique_count += 1
-          unique_buyers.append(row.buyer)
+def update_with_n_unique_buyers(sorted_txns: TransactionTable, offsets: Optional[np.ndarray] = None) -> List[Query4Data]:
+  # The transactions are grouped by token, count the unique buyers of every group in one pass
+  # offsets of the token groups, found from the runs of the tokens unless the caller has them
+  offsets = offsets if offsets is not None else run_offsets(sorted_txns.token_id)
+  token_ids = group_firsts(sorted_txns.token_id, offsets).tolist()
+  n_buyers = count_distinct(sorted_txns.buyer, offsets).tolist()
 
-      # This is for the scenario when the transaction is the last in the array (spreadsheet)
-      if i == n - 1:
-          data = Query4Data(token_id=sorted_txns[i].token_id, n_unique_buyers=unique_count)
-          new_txns.append(data)
-
-      elif sorted_txns[i].token_id != sorted_txns[i+1].token_id:
-          data = Query4Data(token_id=sorted_txns[i].token_id, n_unique_buyers=unique_count)
-          new_txns.append(data)
-
-          unique_count = 0
-          unique_buyers = []
-
-  return new_txns
+  return [Query4Data(token_id=token_id, n_unique_buyers=count) for token_id, count in zip(token_ids, n_buyers)]
 
 def plot_graph(asymptotic_runtimes, actual_runtimes, filename="query_4.png", rows=92):
     x_axis = [i for i in range(rows+1)]
@@ -264,31 +123,25 @@ def plot_graph(asymptotic_runtimes, actual_runtimes, filename="query_4.png", row
 
 def main():
 
-    # getting all the input files
-    files = glob.glob(root_path + "/*.csv")
-    # Read all the files placed in the current wokring directory with csv extenion
-    data = [pd.read_csv(f) for f in files]
-    data = pd.concat(data,ignore_index=True)
-    # drop all null records
-    data = data.dropna()
-    # drop all duplicate records
-    data = data.drop_duplicates()
-
-    # prepare data accordingly as per data types and get required columns
-    transactions = prepare_data(data)
-    transactions = currency_converter(transactions)
+    # load the cleaned transactions, from the cache when the input files have not changed
+    transactions = load_transactions(root_path)
+    # the rows of every token for saving the results, built once per dataset
+    index = load_row_index(root_path, transactions, 'token_id')
 
     elapsed_time_averages = []
     asymptotic_times = []
     rows = int(len(transactions)/1000)
     # Run the sorting in batches of 1000, 2000, 3000, ......
+    # The per group state is kept across the batches, every batch only folds in the rows it adds
+    aggregator = new_aggregator()
     for i in range(rows+1):
         print(f"{(i + 1) * 1000} transactions")
 
         n = (i + 1) * 1000
 
         # run the query for a specified number of runs
-        aveg_elapsed_time_ns = run_n_times(transactions[0: n], no_of_runs, save= i == rows)
+        aggregator.update(transactions[n - 1000: n])
+        aveg_elapsed_time_ns = run_n_times(transactions[0: n], no_of_runs, save= i == rows, data=aggregated_data(aggregator), index=index)
         elapsed_time_averages.append(aveg_elapsed_time_ns)
 
         # this is used to ensure both the asymptotic and actual run time have the same scale while plotting the graph
@@ -303,10 +156,30 @@ def main():
 
     # run_query(transactions, run=1)
 
-def run_n_times(transactions, n, save=False):
+def main_stream(chunksize):
+    # Read the csv files a chunk at a time and only keep the per token state, for datasets that do not fit in memory
+    aggregator = new_aggregator()
+    n = stream_into(root_path, [aggregator], chunksize)
+    print(f"{n} transactions")
+
+    data = aggregated_data(aggregator)
+
+    # collect start time
+    start_time = time.time_ns()
+    sorted_txns = sort_data(data)
+    # collect end time
+    end_time = time.time_ns()
+
+    elapsed_time = (end_time - start_time)
+    print(f"\nThe elapsed time is {elapsed_time} nano secs (i.e {elapsed_time/1e9} secs)\n")
+
+    # the transactions themselves are not kept, so only the per token results are saved
+    save_result(sorted_txns, None, elapsed_time)
+
+def run_n_times(transactions, n, data, save=False, index=None):
     elapsed_times = []
     for i in range(n):
-        elapsed_time, sorted_txns = run_query(transactions, save=save)
+        elapsed_time, sorted_txns = run_query(transactions, save=save, data=data, index=index)
         elapsed_times.append(elapsed_time)
 
     aveg_elapsed_time_ns = sum(elapsed_times)/len(elapsed_times)
@@ -316,13 +189,14 @@ def run_n_times(transactions, n, save=False):
     return aveg_elapsed_time_ns
 
 
-def run_query(transactions, save=False):
-    data = process_data(transactions)
+def run_query(transactions, data, save=False, index=None):
+    # data is the aggregated transactions, kept up to date incrementally by the caller, the sort gets its own copy
+    data = list(data)
 
     # collect start time
     start_time = time.time_ns()
-    # sort the data using radix sort
-    sorted_txns = radix_sort_by_nbuyer(data)
+    # sort the data with the chosen sort backend
+    sorted_txns = sort_data(data)
     # collect end time
     end_time = time.time_ns()
 
@@ -330,41 +204,83 @@ def run_query(transactions, save=False):
 
     if save:
         # save result to output directory
-        save_result(sorted_txns, transactions, elapsed_time)
+        save_result(sorted_txns, transactions, elapsed_time, index)
 
     return elapsed_time, sorted_txns
 
-def process_data(A: List[Query4Input]) -> List[Query4Data]:
-    hash = {}
-    for row in A:
-        if row.token_id in hash:
-            hash[row.token_id].append(row)
-        else:
-            hash[row.token_id] = [row]
-        
-    transactions = []
-    for key in hash:
-        transactions = np.concatenate((transactions, hash[key]))
-
-    A = update_with_n_unique_buyers(transactions)
+def new_aggregator():
+    # exact sets of buyers, or HyperLogLog sketches when an error bound is given with --approximate
+    if approximate_error is not None:
+        return ApproximateUniqueBuyerAggregator(approximate_error)
+    return UniqueBuyerAggregator()
+
+def shard_task():
+    # what the workers of --workers run on their shard: the vectorised grouping, or the sketches with --approximate
+    if approximate_error is not None:
+        return partial(aggregate_with, new_aggregator(), aggregated_data)
+    return process_data
+
+def aggregated_data(aggregator) -> List[Query4Data]:
+    if isinstance(aggregator, ApproximateUniqueBuyerAggregator):
+        return [
+            Query4Data(token_id=token_id, n_unique_buyers=n_buyers, error=error)
+            for token_id, n_buyers, error in aggregator.results()]
+
+    return [Query4Data(token_id=token_id, n_unique_buyers=n_buyers) for token_id, n_buyers in aggregator.results()]
+
+def sort_data(data: List[Query4Data]) -> List[Query4Data]:
+    # only the top tokens with --top, else sort all of them
+    if top is not None:
+        return top_k(data, top, key=lambda row: row.n_unique_buyers)
+    return sort_by_nbuyer(data)
+
+def process_data(A: TransactionTable, index: Optional[RowIndex] = None) -> List[Query4Data]:
+    # rows grouped by token id, the groups in order of first appearance. The row index of the dataset has that
+    # grouping already, only a table without one is grouped here
+    if index is not None:
+        return update_with_n_unique_buyers(A[index.order], index.offsets)
+
+    rows = group_by(A.token_id).order
+
+    A = update_with_n_unique_buyers(A[rows])
     return A
 
 if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--stream", action="store_true", help="read the csv files in chunks instead of all at once")
+    parser.add_argument("--chunksize", type=int, default=DEFAULT_CHUNKSIZE, help="rows per chunk in streaming mode")
+    parser.add_argument("--sort", choices=list(SORT_BACKENDS), default=sort_backend, help="backend of the ranking sort")
+    parser.add_argument("--workers", type=int, default=None, help="aggregate hash shards of the transactions in this many processes")
+    parser.add_argument("--approximate", type=error_bound, default=None, metavar="ERROR",
+                        help="count the distinct values approximately, within this relative standard error")
+    parser.add_argument("--top", type=int, default=None, metavar="K", help="only rank and save the K largest groups")
+    args = parser.parse_args()
+
+    sort_backend = args.sort
+
+    top = args.top
+
+    approximate_error = args.approximate
+
     # declare root path
     global root_path
     root_path = os.getcwd()
 
-    print("Kindly specify the number of runs needed (suggested runs is 1), Example : 1")
-    # No of times the script need to be run
-    global no_of_runs
-    no_of_runs = int(input())
-
     # Output path to store results
     global output_path
     output_path = root_path + "/output"
     
     if not os.path.isdir(output_path):
         os.mkdir(output_path)
-        
 
-    main()
\ No newline at end of file
+    if args.stream:
+        main_stream(args.chunksize)
+    elif args.workers:
+        main_sharded(sys.modules[__name__], shard_task(), 'token_id', root_path, args.workers)
+    else:
+        print("Kindly specify the number of runs needed (suggested runs is 1), Example : 1")
+        # No of times the script need to be run
+        global no_of_runs
+        no_of_runs = int(input())
+
+        main()
@@ -1,11 +1,31 @@
 # imports
 import pandas as pd
 import numpy as np
-from typing import List
+from typing import Iterator, List, Optional
 import matplotlib.pyplot as plt 
 import time
-import glob
 import os
+import sys
+import csv
+import argparse
+from functools import partial
+from transaction_table import TransactionTable
+from grouping import group_by, run_offsets, count_distinct, count_matrix, RowIndex, row_index
+from dataset import load_transactions, load_row_index
+from stream import stream_into, DEFAULT_CHUNKSIZE
+from sorting import sort_records, SORT_BACKENDS
+from sharding import main_sharded, aggregate_with
+from aggregators import BuyerNftAggregator, ApproximateBuyerNftAggregator
+from sketch import error_bound
+
+# error bound of the approximate distinct counts, set with --approximate. None counts them exactly
+approximate_error = None
+
+# backend of the ranking sort, see sorting.py
+sort_backend = 'radix'
+
+# write the transactions per NFT of every buyer to query5_details.csv too, set with --details
+details = False
 
 ##################################################### Data ###################################################
 
@@ -18,6 +38,8 @@ class Query5Data:
     n_txns_for_nft: int
     total_unique_nft: int
     total_txns: int
+    # standard error of total_unique_nft when it is approximate
+    error: Optional[float] = None
 
 @dataclass(order=True)
 class Query5Input:
@@ -25,235 +47,57 @@ class Query5Input:
     nft: str
     token_id: int
 
-@dataclass(order=True)
-class NFTTransaction:
-    txn_hash: str
-    time_stamp: str
-    date_time: str
-    action: str
-    buyer: str
-    nft: str
-    token_id: int
-    type_: int
-    quantity: int
-    price: float
-    price_str: str
-    market: str
-    n_unique_buyers: int
-
-def aux_sort_by_txns(A: List[Query5Data]) -> List[Query5Data]:
-    for i in range(1, len(A)):
-        x = A[i]
-        j = i-1
-
-        while j >= 0 and A[j].total_txns < x.total_txns:
-            A[j + 1] = A[j]
-            j = j - 1
-
-        A[j + 1] = x
-    return A
-
-def sort_by_txns(A: List[Query5Data]) -> List[Query5Data]:
-    B = []
-    start, end = 0, 0
-    flag = True
-
-    for i in range(len(A)):
-        B.append(A[i])
-
-        if i >= len(A) - 1:
-            continue
-
-        if flag and A[i].total_unique_nft != A[i+1].total_unique_nft:
-            start = i+1
-            continue
-
-        if flag and (A[i].total_unique_nft == A[i+1].total_unique_nft):
-            flag = False
-            continue
-
-        if not flag and (A[i].total_unique_nft != A[i+1].total_unique_nft) :
-            end = i
-
-            C = aux_sort_by_txns(A[start:end+1])
-            k = 0
-            for j in range(start, end+1):
-                B[j] = C[k]
-                k += 1
-
-
-            start = i+1
-            flag = True
-
-    return B
-
-#################################################### Radix sort ##############################################
-
-def counting_sort_by_n_nft(A: List[Query5Data], exp) -> List[Query5Data]:
-    n = len(A)
- 
-    # The output array elements that will have sorted arr
-    output = [0] * (n)
- 
-    # initialize count array as 0
-    count = [0] * (10)
- 
-    # Store count of occurrences in count[]
-    for i in range(0, n):
-        index = int(A[i].total_unique_nft) // exp
-        index = int(index)
-
-        count[index % 10] += 1
- 
-    # Change count[i] so that count[i] now contains actual
-    # position of this digit in output array
-    for i in range(1, 10):
-        count[i] += count[i - 1]
- 
-    # Build the output array
-    i = n - 1
-    while i >= 0:
-        index = int(A[i].total_unique_nft) // exp
-        index = int(index)
-
-        output[count[index % 10] - 1] = A[i]
-        count[index % 10] -= 1
-        i -= 1
- 
-    return output
- 
-# Method to do Radix Sort
-def radix_sort_by_n_nft(A: List[Query5Data]) -> List[Query5Data]:
-    # Find the maximum number to know number of digits
-    max1 = max_by_n_nft(A)
- 
-    # Do counting sort for every digit. Note that instead
-    # of passing digit number, exp is passed. exp is 10^i
-    # where i is current digit number
-    exp = 1
-    while max1 / exp >= 1:
-        A = counting_sort_by_n_nft(A, exp)
-        exp *= 10
-
-    B = []
-    n = len(A)
-    for i in range(n):
-        B.append(A[n - i - 1])
-
-    return B
-
-def max_by_n_nft(A: List[Query5Data]) -> List[Query5Data]:
-    max = 0
-    for value in A:
-        total_unique_nft = int(value.total_unique_nft)
-        if  total_unique_nft > max:
-            max = total_unique_nft
+#################################################### Sorting ##############################################
 
-    return max
+def sort_by_n_nft_and_txns(A: List[Query5Data]) -> List[Query5Data]:
+    # descending by the number of unique NFTs, then by the number of transactions, equal ones latest first. One
+    # stable pass per key with the sort backend chosen by --sort
+    return sort_records(A, keys=[lambda row: row.total_unique_nft, lambda row: row.total_txns], descending=True,
+                        latest_first=True, backend=sort_backend)
 
 ########################################## Utils #####################################################
 
-def get_all_transactions(data: List[NFTTransaction]):
-    hash = {}
+def save_result(data: List[Query5Data], transactions: Optional[TransactionTable], elapsed_time, index: Optional[RowIndex] = None):
+    all_txns = None
+    if transactions is not None:
+        # the rows of every buyer, from the index of the dataset when the caller has loaded it
+        index = index if index is not None else row_index(transactions.buyer)
+        all_txns = index.relabel(transactions.text('buyer', index.keys))
 
-    for row in data:
-        if row.buyer in hash:
-            hash[row.buyer].append(row)
-        else:
-            hash[row.buyer] = [row]
-
-    return hash
-
-def save_result(data: List[Query5Data], all_txns, elapsed_time):
-    all_txns = get_all_transactions(all_txns)
+    # the records of all the rows are built at once, column by column
+    records = transactions.rows() if transactions is not None else None
 
     with open(output_path + "/query5_out.txt", "w") as file:
         file.writelines(f"The execution time is {elapsed_time} nano secs\n\n")
 
         for row in data:
-            file.writelines(f"{row.buyer} (frequency (unique NFTs = {row.total_unique_nft}, total NFTs = {row.total_txns})\n")
+            unique_nfts = f"{row.total_unique_nft}" if row.error is None else f"{row.total_unique_nft} ± {row.error:.1f}"
+            file.writelines(f"{row.buyer} (frequency (unique NFTs = {unique_nfts}, total NFTs = {row.total_txns})\n")
+            # only the per group results are known in streaming mode
+            if all_txns is None:
+                continue
+
             file.writelines("Token ID,\t Txn hash,\t Date Time (UTC),\t Buyer,\t NFT,\t Type,\t Quantity,\t Price (USD)\n")
             file.writelines("\n")
-            for value in all_txns[row.buyer]:
+            for i in all_txns[row.buyer]:
+                value = records[i]
                 file.writelines(f"{value.token_id},\t\t {value.txn_hash},\t {value.date_time},\t {value.buyer},\t {value.nft},\t {value.type_},\t {value.quantity},\t {value.price}\n")
 
             file.writelines("\n\n")
 
+    if details and transactions is not None:
+        save_details(data, transactions, index)
+
+def save_details(data: List[Query5Data], transactions: TransactionTable, index: RowIndex):
+    # The transactions per NFT of the ranked buyers, in the order of the ranking, to query5_details.csv. There is a
+    # row per (buyer, NFT) pair, so they are written as they are made instead of being collected first
+    buyer_codes = dict(zip(np.asarray(transactions.text('buyer', index.keys)).tolist(), index.keys.tolist()))
+    with open(output_path + "/query5_details.csv", "w", newline="") as file:
+        writer = csv.writer(file)
+        writer.writerow(['Buyer', 'NFT', 'Transactions Per NFT', 'Total NFT', 'Total Transactions'])
+        for row in iter_n_unique_nfts(transactions, buyers=[buyer_codes[row.buyer] for row in data]):
+            writer.writerow([row.buyer, row.nft, row.n_txns_for_nft, row.total_unique_nft, row.total_txns])
 
-def currency_converter(data: List[NFTTransaction]) -> List[NFTTransaction]:
-  for row in data:
-    price = row.price_str
-
-    if type(price) is not str:
-      row.price = float(float(price) * 1.00)
-      continue
-
-    try:
-      price, currency, _ = price.split(" ")
-      price = price.replace(",", "")
-
-      if currency == "ETH":
-        row.price = float(float(price) * 1309.97)
-      
-      elif currency == "WETH":
-        row.price = float(float(price) * 1322.16)
-
-      elif currency == "ASH":
-        row.price = float(float(price) * 0.9406)
-      
-      elif currency == "GALA":
-        row.price = float(float(price) * 0.03748)
-        
-      elif currency == "TATR":
-        row.price = float(float(price) * 0.012056)
-        
-      elif currency == "USDC":
-        row.price = float(float(price) * 1.00)
-        
-      elif currency == "MANA":
-        row.price = float(float(price) * 0.64205)
-        
-      elif currency == "SAND":
-        row.price = float(float(price) * 0.7919)
-        
-      elif currency == "RARI":
-        row.price = float(float(price) * 2.18)
-        
-      elif currency == "CTZN":
-        row.price = float(float(price) * 0.00321)
-        
-      elif currency == "APE":
-        row.price = float(float(price) * 4.62)
-
-      else:
-        row.price = float(float(price) * 1.00)
-
-    except ValueError:
-      None
-      
-  return data
-
-def prepare_data(data) -> List[NFTTransaction]:
-  data = data.reset_index()  # make sure indexes pair with number of rows
-
-  transactions = []
-  for i, row in data.iterrows():
-    transactions.append(NFTTransaction(
-        txn_hash=row['Txn Hash'], 
-        time_stamp=row['UnixTimestamp'],
-        date_time=row['Date Time (UTC)'],
-        action=row['Action'],
-        buyer=row['Buyer'],
-        nft=row['NFT'],
-        token_id=row['Token ID'],
-        type_=row['Type'],
-        quantity=row['Quantity'],
-        price_str=row['Price'],
-        price=0.0,
-        market=row['Market'],
-        n_unique_buyers=0))
-    
-  return transactions
 
 def get_dataframe(data: List[Query5Data]):
   txns_list = []
@@ -277,92 +121,44 @@ def get_dataframe(data: List[Query5Data]):
   df.to_excel(output_path + "/query5_out.xlsx")
   return df
 
-def update_with_n_unique_nfts(sorted_txns: List[Query5Input]) -> List[Query5Data]:
-  # Lets sort the token ids by the number of unique buyers
-  txns_count = 0
-  n = len(sorted_txns)
-
-  new_txn_list = []
-
-  nft_txn_dic = {}
-  
-  for i, row in enumerate(sorted_txns):
-      txns_count += 1
-
-      if row.nft in nft_txn_dic.keys():
-        nft_txn_dic[row.nft] += 1
-
-      else:
-        nft_txn_dic[row.nft] = 1
-
-      # This is for the scenario when the transaction is the last in the array (spreadsheet)
-      if i == n - 1:
-          for k, v in nft_txn_dic.items():
-              data = Query5Data(
-                sorted_txns[i].buyer, 
-                nft=k, n_txns_for_nft=v, 
-                total_unique_nft=len(nft_txn_dic.keys()), 
-                total_txns=txns_count)
-
-              new_txn_list.append(data)
-
-          nft_txn_dic = {}
-          txns_count = 0
-
-      elif sorted_txns[i].buyer != sorted_txns[i+1].buyer:
-          for k, v in nft_txn_dic.items():
-              data = Query5Data(
-                sorted_txns[i].buyer, 
-                nft=k, n_txns_for_nft=v, 
-                total_unique_nft=len(nft_txn_dic.keys()), 
-                total_txns=txns_count)
-
-              new_txn_list.append(data)
-
-          nft_txn_dic = {}
-          txns_count = 0
-
-  return new_txn_list
-
-def update_with_n_unique_nfts_without_nft_names(sorted_txns: List[Query5Input]) -> List[Query5Data]:
-  unique_nft_count = 0
-  txns_count = 0
-  unique_nfts = []
-  n = len(sorted_txns)
-
-  new_txn_list = []
-  
-  for i, row in enumerate(sorted_txns):
-      txns_count += 1
-
-      if row.nft not in unique_nfts:
-          unique_nft_count += 1
-          unique_nfts.append(row.nft)
-
-      # This is for the scenario when the transaction is the last in the array (spreadsheet)
-      if i == n - 1:
-          data = Query5Data(
-            sorted_txns[i].buyer, 
-            nft=None, n_txns_for_nft=None, 
-            total_unique_nft=unique_nft_count, 
-            total_txns=txns_count)
-
-          new_txn_list.append(data)
-
-      elif sorted_txns[i].buyer != sorted_txns[i+1].buyer:
-          data = Query5Data(
-            sorted_txns[i].buyer, 
-            nft=None, n_txns_for_nft=None, 
-            total_unique_nft=unique_nft_count, 
-            total_txns=txns_count)
-
-          new_txn_list.append(data)
-
-          unique_nfts = []
-          txns_count = 0
-          unique_nft_count = 0
-
-  return new_txn_list
+def iter_n_unique_nfts(sorted_txns: TransactionTable, buyers=None) -> Iterator[Query5Data]:
+  # One row per (buyer, NFT) with the buyer's transactions of that NFT. The counts are a sparse buyer x NFT matrix
+  # built in one pass over the codes: its row sums are the buyers' total transactions and the number of entries in
+  # a row their number of unique NFTs. The rows are only materialised for the given buyer codes, in their order, and
+  # for all the buyers in order of first appearance by default
+  matrix = count_matrix(sorted_txns.buyer, sorted_txns.nft)
+  total_txns = matrix.row_sums().tolist()
+  total_unique_nfts = matrix.row_nnz().tolist()
+
+  rows = range(len(matrix))
+  if buyers is not None:
+    row_of = dict(zip(matrix.row_keys.tolist(), range(len(matrix))))
+    rows = [row_of[buyer] for buyer in np.asarray(buyers).tolist() if buyer in row_of]
+
+  for r in rows:
+      buyer = sorted_txns.text('buyer', matrix.row_keys[r])
+      nfts, counts = matrix.row(r)
+      for nft, count in zip(np.asarray(sorted_txns.text('nft', nfts)).tolist(), counts.tolist()):
+          yield Query5Data(
+            buyer,
+            nft=nft, n_txns_for_nft=count,
+            total_unique_nft=total_unique_nfts[r],
+            total_txns=total_txns[r])
+
+def update_with_n_unique_nfts(sorted_txns: TransactionTable, buyers=None) -> List[Query5Data]:
+  return list(iter_n_unique_nfts(sorted_txns, buyers))
+
+def update_with_n_unique_nfts_without_nft_names(sorted_txns: TransactionTable, offsets: Optional[np.ndarray] = None) -> List[Query5Data]:
+  # The transactions are grouped by buyer, count the unique NFTs and all the transactions of every group in one pass
+  # offsets of the buyer groups, found from the runs of the buyers unless the caller has them
+  offsets = offsets if offsets is not None else run_offsets(sorted_txns.buyer)
+  buyers = sorted_txns.decode('buyer', offsets[1:] - 1).tolist()
+  n_nfts = count_distinct(sorted_txns.nft, offsets).tolist()
+  n_txns = np.diff(offsets).tolist()
+
+  return [
+    Query5Data(buyer, nft=None, n_txns_for_nft=None, total_unique_nft=unique_nft_count, total_txns=txns_count)
+    for buyer, unique_nft_count, txns_count in zip(buyers, n_nfts, n_txns)]
 
 
 def plot_graph(asymptotic_runtimes, actual_runtimes, filename="query_5.png", rows=92):
@@ -382,31 +178,25 @@ def plot_graph(asymptotic_runtimes, actual_runtimes, filename="query_5.png", row
 ############################################ Main Program ######################################################
 
 def main():
-    # getting all the input files
-    files = glob.glob(root_path + "/*.csv")
-    # Read all the files placed in the current wokring directory with csv extenion
-    data = [pd.read_csv(f) for f in files]
-    data = pd.concat(data, ignore_index=True)
-    # drop all null records
-    data = data.dropna()
-    # drop all duplicate records
-    data = data.drop_duplicates()
-
-    # prepare data accordingly as per data types and get required columns
-    transactions = prepare_data(data)
-    transactions = currency_converter(transactions)
+    # load the cleaned transactions, from the cache when the input files have not changed
+    transactions = load_transactions(root_path)
+    # the rows of every buyer for saving the results, built once per dataset
+    index = load_row_index(root_path, transactions, 'buyer')
 
     elapsed_time_averages = []
     asymptotic_times = []
     rows = int(len(transactions) / 1000)
     # Run the sorting in batches of 1000, 2000, 3000, ......
+    # The per group state is kept across the batches, every batch only folds in the rows it adds
+    aggregator = new_aggregator()
     for i in range(rows + 1):
         print(f"{(i + 1) * 1000} transactions")
 
         n = (i + 1) * 1000
 
         # run the query for a specified number of runs
-        aveg_elapsed_time_ns = run_n_times(transactions[0: n], no_of_runs, save= i == rows)
+        aggregator.update(transactions[n - 1000: n])
+        aveg_elapsed_time_ns = run_n_times(transactions[0: n], no_of_runs, save= i == rows, data=aggregated_data(aggregator), index=index)
         elapsed_time_averages.append(aveg_elapsed_time_ns)
 
         # this is used to ensure both the asymptotic and actual run time have the same scale while plotting the graph
@@ -422,10 +212,30 @@ def main():
     # elapsed_time, sorted_txns = run_query(transactions, save=True)
 
 
-def run_n_times(transactions, n, save=False):
+def main_stream(chunksize):
+    # Read the csv files a chunk at a time and only keep the per buyer state, for datasets that do not fit in memory
+    aggregator = new_aggregator()
+    n = stream_into(root_path, [aggregator], chunksize)
+    print(f"{n} transactions")
+
+    data = aggregated_data(aggregator)
+
+    # collect start time
+    start_time = time.time_ns()
+    sorted_txns = sort_data(data)
+    # collect end time
+    end_time = time.time_ns()
+
+    elapsed_time = (end_time - start_time)
+    print(f"\nThe elapsed time is {elapsed_time} nano secs (i.e {elapsed_time/1e9} secs)\n")
+
+    # the transactions themselves are not kept, so only the per buyer results are saved
+    save_result(sorted_txns, None, elapsed_time)
+
+def run_n_times(transactions, n, data, save=False, index=None):
     elapsed_times = []
     for i in range(n):
-        elapsed_time, sorted_txns = run_query(transactions, save=save)
+        elapsed_time, sorted_txns = run_query(transactions, save=save, data=data, index=index)
         elapsed_times.append(elapsed_time)
 
     aveg_elapsed_time_ns = sum(elapsed_times)/len(elapsed_times)
@@ -434,52 +244,82 @@ def run_n_times(transactions, n, save=False):
 
     return aveg_elapsed_time_ns
     
-def run_query(transactions, save=False):
-    data = process_data(transactions)
+def run_query(transactions, data, save=False, index=None):
+    # data is the aggregated transactions, kept up to date incrementally by the caller, the sort gets its own copy
+    data = list(data)
     
     # collect start time
-    start_time1 = time.time_ns()
-    # sort using radix sort
-    sorted_txns = radix_sort_by_n_nft(data)
+    start_time = time.time_ns()
+    # sort by the number of unique NFTs, then by the number of transactions
+    sorted_txns = sort_by_n_nft_and_txns(data)
     # collect end time
-    end_time1 = time.time_ns()
+    end_time = time.time_ns()
 
-    start_time2 = time.time_ns()
-    sorted_txns = sort_by_txns(sorted_txns)
-    end_time2 = time.time_ns()
-
-    elapsed_time = (end_time1 - start_time1) + (end_time2 - start_time2)
+    elapsed_time = (end_time - start_time)
 
     if save:
-        save_result(sorted_txns, transactions, elapsed_time)
+        save_result(sorted_txns, transactions, elapsed_time, index)
 
     return elapsed_time, sorted_txns
 
-def process_data(A: List[Query5Input]):
-    hash = {}
-    for row in A:
-        if row.buyer in hash:
-            hash[row.buyer].append(row)
-        else:
-            hash[row.buyer] = [row]
-        
-    transactions = []
-    for key in hash:
-        transactions = np.concatenate((transactions, hash[key]))
-
-    A = update_with_n_unique_nfts_without_nft_names(transactions)
+def new_aggregator():
+    # exact sets of NFTs, or HyperLogLog sketches when an error bound is given with --approximate
+    if approximate_error is not None:
+        return ApproximateBuyerNftAggregator(approximate_error)
+    return BuyerNftAggregator()
+
+def shard_task():
+    # what the workers of --workers run on their shard: the vectorised grouping, or the sketches with --approximate
+    if approximate_error is not None:
+        return partial(aggregate_with, new_aggregator(), aggregated_data)
+    return process_data
+
+def aggregated_data(aggregator) -> List[Query5Data]:
+    if isinstance(aggregator, ApproximateBuyerNftAggregator):
+        return [
+            Query5Data(buyer, nft=None, n_txns_for_nft=None, total_unique_nft=n_nfts, total_txns=n_txns, error=error)
+            for buyer, n_nfts, n_txns, error in aggregator.results()]
+
+    return [
+        Query5Data(buyer, nft=None, n_txns_for_nft=None, total_unique_nft=n_nfts, total_txns=n_txns)
+        for buyer, n_nfts, n_txns in aggregator.results()]
+
+def sort_data(data: List[Query5Data]) -> List[Query5Data]:
+    # sort by the number of unique NFTs, then by the number of transactions
+    return sort_by_n_nft_and_txns(data)
+
+def process_data(A: TransactionTable, index: Optional[RowIndex] = None):
+    # rows grouped by buyer, the groups in order of first appearance. The row index of the dataset has that
+    # grouping already, only a table without one is grouped here
+    if index is not None:
+        return update_with_n_unique_nfts_without_nft_names(A[index.order], index.offsets)
+
+    rows = group_by(A.buyer).order
+
+    A = update_with_n_unique_nfts_without_nft_names(A[rows])
     return A
 
 if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--stream", action="store_true", help="read the csv files in chunks instead of all at once")
+    parser.add_argument("--chunksize", type=int, default=DEFAULT_CHUNKSIZE, help="rows per chunk in streaming mode")
+    parser.add_argument("--sort", choices=list(SORT_BACKENDS), default=sort_backend, help="backend of the ranking sort")
+    parser.add_argument("--workers", type=int, default=None, help="aggregate hash shards of the transactions in this many processes")
+    parser.add_argument("--approximate", type=error_bound, default=None, metavar="ERROR",
+                        help="count the distinct values approximately, within this relative standard error")
+    parser.add_argument("--details", action="store_true", help="also write the transactions per NFT of every buyer to query5_details.csv")
+    args = parser.parse_args()
+
+    sort_backend = args.sort
+
+    approximate_error = args.approximate
+
+    details = args.details
+
     # declare root path
     global root_path
     root_path = os.getcwd()
 
-    print("Kindly specify the number of runs needed (suggested runs is 1), Example : 1")
-    # No of times the script need to be run
-    global no_of_runs
-    no_of_runs = int(input())
-
     # Output path to store results
     global output_path
     output_path = root_path + "/output"
@@ -487,4 +327,14 @@ if __name__ == "__main__":
     if not os.path.isdir(output_path):
         os.mkdir(output_path)
 
-    main()
\ No newline at end of file
+    if args.stream:
+        main_stream(args.chunksize)
+    elif args.workers:
+        main_sharded(sys.modules[__name__], shard_task(), 'buyer', root_path, args.workers)
+    else:
+        print("Kindly specify the number of runs needed (suggested runs is 1), Example : 1")
+        # No of times the script need to be run
+        global no_of_runs
+        no_of_runs = int(input())
+
+        main()
@@ -1,12 +1,23 @@
 # imports
 import pandas as pd
 import numpy as np
-from typing import List
+from typing import List, Optional
 import matplotlib.pyplot as plt 
 import time
-from datetime import datetime
-import glob
+from schema import NOT_A_TIME
 import os
+import sys
+import argparse
+from transaction_table import TransactionTable
+from grouping import group_by, run_offsets, count_distinct, RowIndex, row_index
+from dataset import load_transactions, load_row_index
+from stream import stream_into, DEFAULT_CHUNKSIZE
+from sorting import sort_records, SORT_BACKENDS
+from sharding import main_sharded
+from aggregators import FraudFeatureAggregator
+
+# backend of the ranking sort, see sorting.py
+sort_backend = 'merge'
 
 ##################################################### Data ###################################################
 from dataclasses import dataclass, field
@@ -24,242 +35,41 @@ class Query6Data:
     fraudulent: str
     fraudulent_ascii: int
 
-@dataclass(order=True)
-class NFTTransaction:
-    txn_hash: str
-    time_stamp: str
-    date_time: str
-    action: str
-    buyer: str
-    nft: str
-    token_id: int
-    type_: int
-    quantity: int
-    price: float
-    price_str: str
-    market: str
-    n_unique_buyers: int
-
-#################################################### Merge sort ##############################################
-def merge_sort_by_ntxn(A: List[Query6Data]):
-    if len(A) == 1:
-        return A
-
-    q = int(len(A)/2)
-    B = A[:q]
-    C = A[q:]
-
-    L = merge_sort_by_ntxn(B)
-    R = merge_sort_by_ntxn(C)
-    return merge_by_ntxn(L, R)
-
-def merge_by_ntxn(L: List[Query6Data], R: List[Query6Data]):
-    n = len(L) + len(R)
-    i = j = 0
-    B = []
-    for k in range(0, n):
-        if j >= len(R) or (i < len(L) and L[i].n_txns >= R[j].n_txns):
-            B.append(L[i])
-            i = i + 1
-        else:
-            B.append(R[j])
-            j = j + 1
-
-    return B
-
-def merge_sort_by_fraudulent(A: List[Query6Data]) -> List[Query6Data]:
-    if len(A) == 1:
-        return A
-
-    q = int(len(A)/2)
-    B = A[:q]
-    C = A[q:]
-
-    L = merge_sort_by_fraudulent(B)
-    R = merge_sort_by_fraudulent(C)
-    return merge_by_fraudulent(L, R)
-
-def merge_by_fraudulent(L: List[Query6Data], R: List[Query6Data]) -> List[Query6Data]:
-    n = len(L) + len(R)
-    i = j = 0
-    B = []
-    for k in range(0, n):
-        if j >= len(R) or (i < len(L) and ((L[i].fraudulent_ascii) >= (R[j].fraudulent_ascii))):
-            B.append(L[i])
-            i = i + 1
-        else:
-            B.append(R[j])
-            j = j + 1
-
-    return B
-
-#################################################### Radix sort ##############################################
-
-def counting_sort_by_fraudulent(A: List[Query6Data], exp) -> List[Query6Data]:
-    n = len(A)
- 
-    # The output array elements that will have sorted arr
-    output = [0] * (n)
- 
-    # initialize count array as 0
-    count = [0] * (10)
- 
-    # Store count of occurrences in count[]
-    for i in range(0, n):
-        index = int(A[i].fraudulent_ascii) // exp
-        index = int(index)
-
-        count[index % 10] += 1
- 
-    # Change count[i] so that count[i] now contains actual
-    # position of this digit in output array
-    for i in range(1, 10):
-        count[i] += count[i - 1]
- 
-    # Build the output array
-    i = n - 1
-    while i >= 0:
-        index = int(A[i].fraudulent_ascii) // exp
-        index = int(index)
-
-        output[count[index % 10] - 1] = A[i]
-        count[index % 10] -= 1
-        i -= 1
- 
-    return output
- 
-# Method to do Radix Sort
-def radix_sort_by_fraudulent(A: List[Query6Data]) -> List[Query6Data]:
-    # Find the maximum number to know number of digits
-    max1 = max_by_fraudulent(A)
- 
-    # Do counting sort for every digit. Note that instead
-    # of passing digit number, exp is passed. exp is 10^i
-    # where i is current digit number
-    exp = 1
-    while max1 / exp >= 1:
-        A = counting_sort_by_fraudulent(A, exp)
-        exp *= 10
-
-    B = []
-    n = len(A)
-    for i in range(n):
-        B.append(A[n - i - 1])
-
-    return B
 
-def max_by_fraudulent(A: List[Query6Data]) -> List[Query6Data]:
-    max = 0
-    for value in A:
-        fraudulent_ascii = int(value.fraudulent_ascii)
-        if  fraudulent_ascii > max:
-            max = fraudulent_ascii
+#################################################### Sorting ##############################################
 
-    return max
+def sort_by_fraudulent(A: List[Query6Data]) -> List[Query6Data]:
+    # descending by the statuses, equal ones in their input order, with the sort backend chosen by --sort
+    return sort_records(A, key=lambda row: row.fraudulent_ascii, descending=True, backend=sort_backend)
 
 ########################################## Utils #####################################################
 
-def get_all_transactions(data: List[NFTTransaction]):
-    hash = {}
+def save_result(data: List[Query6Data], transactions: Optional[TransactionTable], elapsed_time, index: Optional[RowIndex] = None):
+    all_txns = None
+    if transactions is not None:
+        # the rows of every token, from the index of the dataset when the caller has loaded it
+        all_txns = index if index is not None else row_index(transactions.token_id)
 
-    for row in data:
-        if row.token_id in hash:
-            hash[row.token_id].append(row)
-        else:
-            hash[row.token_id] = [row]
-
-    return hash
-
-def save_result(data: List[Query6Data], all_txns, elapsed_time):
-    all_txns = get_all_transactions(all_txns)
+    # the records of all the rows are built at once, column by column
+    records = transactions.rows() if transactions is not None else None
 
     with open(output_path + "/query6_out.txt", "w") as file:
         file.writelines(f"The execution time is {elapsed_time} nano secs\n\n")
 
         for row in data:
             file.writelines(f"{row.token_id} (frequency (number of transactions = {row.n_txns}, number of unique buyers = {row.n_unique_buyers}, status = {row.fraudulent})\n")
+            # only the per group results are known in streaming mode
+            if all_txns is None:
+                continue
+
             file.writelines("Token ID,\t Txn hash,\t Date Time (UTC),\t Buyer,\t NFT,\t Type,\t Quantity,\t Price (USD)\n")
             file.writelines("\n")
-            for value in all_txns[row.token_id]:
+            for i in all_txns[row.token_id]:
+                value = records[i]
                 file.writelines(f"{value.token_id},\t\t {value.txn_hash},\t {value.date_time},\t {value.buyer},\t {value.nft},\t {value.type_},\t {value.quantity},\t {value.price}\n")
 
             file.writelines("\n\n")
 
-def currency_converter(data: List[NFTTransaction]) -> List[NFTTransaction]:
-  for row in data:
-    price = row.price_str
-
-    if type(price) is not str:
-      row.price = float(float(price) * 1.00)
-      continue
-
-    try:
-      price, currency, _ = price.split(" ")
-      price = price.replace(",", "")
-
-      if currency == "ETH":
-        row.price = float(float(price) * 1309.97)
-      
-      elif currency == "WETH":
-        row.price = float(float(price) * 1322.16)
-
-      elif currency == "ASH":
-        row.price = float(float(price) * 0.9406)
-      
-      elif currency == "GALA":
-        row.price = float(float(price) * 0.03748)
-        
-      elif currency == "TATR":
-        row.price = float(float(price) * 0.012056)
-        
-      elif currency == "USDC":
-        row.price = float(float(price) * 1.00)
-        
-      elif currency == "MANA":
-        row.price = float(float(price) * 0.64205)
-        
-      elif currency == "SAND":
-        row.price = float(float(price) * 0.7919)
-        
-      elif currency == "RARI":
-        row.price = float(float(price) * 2.18)
-        
-      elif currency == "CTZN":
-        row.price = float(float(price) * 0.00321)
-        
-      elif currency == "APE":
-        row.price = float(float(price) * 4.62)
-
-      else:
-        row.price = float(float(price) * 1.00)
-
-    except ValueError:
-      None
-      
-  return data
-
-def prepare_data(data) -> List[NFTTransaction]:
-  data = data.reset_index()  # make sure indexes pair with number of rows
-
-  transactions = []
-  for i, row in data.iterrows():
-    transactions.append(NFTTransaction(
-        txn_hash=row['Txn Hash'], 
-        time_stamp=row['UnixTimestamp'],
-        date_time=row['Date Time (UTC)'],
-        action=row['Action'],
-        buyer=row['Buyer'],
-        nft=row['NFT'],
-        token_id=row['Token ID'],
-        type_=row['Type'],
-        quantity=row['Quantity'],
-        price_str=row['Price'],
-        price=0.0,
-        market=row['Market'],
-        n_unique_buyers=0))
-    
-  return transactions
-
 def get_dataframe(data: List[Query6Data]):
   txns_list = []
 
@@ -279,77 +89,50 @@ def get_dataframe(data: List[Query6Data]):
   df = pd.DataFrame.from_records(txns_list)
   return df
 
-def update_with_n_unique_txns(sorted_txns: List[NFTTransaction]) -> List[Query6Data]:
-  # Lets sort the token ids by the number of txns
-  unique_txn_count = 0
-  unique_txns = []
-
-  unique_buyer_count = 0
-  unique_buyers = []
+def update_with_n_unique_txns(sorted_txns: TransactionTable, offsets: Optional[np.ndarray] = None) -> List[Query6Data]:
+  # The transactions are grouped by token, count the unique txns and buyers of every group in one pass and pick
+  # the first and the last three buy dates
   n = len(sorted_txns)
-  
-  new_txns_list = []
-
-  first_buy_date = ""
-  last_buy_date = ""
-  for i, row in enumerate(sorted_txns):
-      if i == 0:
-        first_buy_date = sorted_txns[i].date_time
-
-      if row.txn_hash not in unique_txns:
-          unique_txn_count += 1
-          unique_txns.append(row.txn_hash)
-
-      if row.buyer not in unique_buyers:
-          unique_buyer_count += 1
-          unique_buyers.append(row.buyer)
-
-
-      if i == n - 1:
-          last_buy_date = sorted_txns[i].date_time
-
-          second_last_buy_date = None
-          if sorted_txns[i].token_id == sorted_txns[i-1].token_id:
-            second_last_buy_date = sorted_txns[i-1].date_time
-
-          third_last_buy_date = None
-          if sorted_txns[i].token_id == sorted_txns[i-2].token_id:
-            third_last_buy_date = sorted_txns[i-2].date_time
-
-          new_txns_list.append(get_txn(first_buy_date, last_buy_date, second_last_buy_date, third_last_buy_date, sorted_txns[i].token_id, unique_txn_count, unique_buyer_count))
-          
-      elif sorted_txns[i].token_id != sorted_txns[i+1].token_id:
-          last_buy_date = sorted_txns[i].date_time
-
-          second_last_buy_date = None
-          if sorted_txns[i].token_id == sorted_txns[i-1].token_id:
-            second_last_buy_date = sorted_txns[i-1].date_time
+  if n == 0:
+    return []
+
+  token_ids = sorted_txns.token_id
+  # offsets of the token groups, found from the runs of the tokens unless the caller has them
+  offsets = offsets if offsets is not None else run_offsets(token_ids)
+  first, last = offsets[:-1], offsets[1:] - 1
+  # the second and third last rows are only taken when they are of the same token. Like i-1 and i-2 they wrap
+  # around to the end of the table
+  second_last, third_last = (last - 1) % n, (last - 2) % n
+  has_second_last = (token_ids[second_last] == token_ids[last]).tolist()
+  has_third_last = (token_ids[third_last] == token_ids[last]).tolist()
+
+  dates = [sorted_txns.decode('date_time', rows).tolist() for rows in (first, last, second_last, third_last)]
+  minutes = [sorted_txns.date_minutes[rows].tolist() for rows in (first, last, second_last, third_last)]
+  n_txns = count_distinct(sorted_txns.txn_hash, offsets).tolist()
+  n_buyers = count_distinct(sorted_txns.buyer, offsets).tolist()
 
-          third_last_buy_date = None
-          if sorted_txns[i].token_id == sorted_txns[i-2].token_id:
-            third_last_buy_date = sorted_txns[i-2].date_time
-
-          new_txns_list.append(get_txn(first_buy_date, last_buy_date, second_last_buy_date, third_last_buy_date, sorted_txns[i].token_id, unique_txn_count, unique_buyer_count))
-          
-          unique_txn_count = 0
-          unique_txns = []
-
-          unique_buyer_count = 0
-          unique_buyers = []
-
-          first_buy_date = sorted_txns[i+1].date_time
+  new_txns_list = []
+  for g, token_id in enumerate(token_ids[last].tolist()):
+      second_last_buy_date = dates[2][g] if has_second_last[g] else None
+      third_last_buy_date = dates[3][g] if has_third_last[g] else None
+      buy_minutes = (minutes[0][g], minutes[1][g],
+                     minutes[2][g] if has_second_last[g] else None,
+                     minutes[3][g] if has_third_last[g] else None)
+      new_txns_list.append(get_txn(dates[0][g], dates[1][g], second_last_buy_date, third_last_buy_date, token_id, n_txns[g], n_buyers[g], buy_minutes))
 
   return new_txns_list
 
-def get_txn(first_buy_date, last_buy_date, second_last_buy_date, third_last_buy_date, tokenid, n_txns, n_buyers):
+def get_txn(first_buy_date, last_buy_date, second_last_buy_date, third_last_buy_date, tokenid, n_txns, n_buyers, buy_minutes):
+  # buy_minutes are the first, last, second last and third last buy dates parsed to minutes since the epoch
   fraudulent = "No"
   interval_threshold_hr = 1
   ntxn_nbuyer_ratio = 1.8
+  first_buy_minutes, last_buy_minutes, second_last_buy_minutes, third_last_buy_minutes = buy_minutes
 
   if float(n_txns/n_buyers) > ntxn_nbuyer_ratio and (
-    hours_between(last_buy_date, first_buy_date) <= interval_threshold_hr or 
-    hours_between(second_last_buy_date, first_buy_date) <= interval_threshold_hr or 
-    hours_between(third_last_buy_date, first_buy_date) <= interval_threshold_hr
+    hours_between(last_buy_minutes, first_buy_minutes) <= interval_threshold_hr or 
+    hours_between(second_last_buy_minutes, first_buy_minutes) <= interval_threshold_hr or 
+    hours_between(third_last_buy_minutes, first_buy_minutes) <= interval_threshold_hr
     ):
 
     fraudulent = "Yes"
@@ -369,22 +152,16 @@ def get_txn(first_buy_date, last_buy_date, second_last_buy_date, third_last_buy_
       fraudulent_ascii=convert_string_to_ascii(fraudulent)
     )
 
-def hours_between(last_date, start_date):
-  try:
-    last_date = str(last_date)
-    start_date = str(start_date)
-
-    f = "%m/%d/%Y %H:%M"
-    t1 = datetime.strptime(last_date, f)
-    t2 = datetime.strptime(start_date, f)
-
-    diff_in_hours = (t1 - t2).seconds/360
-    return diff_in_hours
-  except Exception:
-
-    # We realized that if the date is in an inconsistent format, it throws an error. So this error handler avoids that scenario
+def hours_between(last_minutes, start_minutes):
+  # We realized that if the date is in an inconsistent format it can not be parsed, such dates (and missing ones)
+  # count as 2 hours apart
+  if last_minutes is None or start_minutes is None or NOT_A_TIME in (last_minutes, start_minutes):
     return 2
 
+  # the seconds part of the time difference, as timedelta.seconds gives it
+  diff_in_hours = ((last_minutes - start_minutes) * 60 % 86400)/360
+  return diff_in_hours
+
 def plot_graph(asymptotic_runtimes, actual_runtimes, filename="query_6.png", rows=92):
     x_axis = [i for i in range(rows+1)]
     plt.plot(x_axis, asymptotic_runtimes, color ='red')
@@ -406,31 +183,25 @@ def convert_string_to_ascii(input):
 
 
 def main():
-    # getting all the input files
-    files = glob.glob(root_path + "/*.csv")
-    # Read all the files placed in the current wokring directory with csv extenion
-    data = [pd.read_csv(f) for f in files]
-    data = pd.concat(data, ignore_index=True)
-    # drop all null records
-    data = data.dropna()
-    # drop all duplicate records
-    data = data.drop_duplicates()
-
-    # prepare data accordingly as per data types and get required columns
-    transactions = prepare_data(data)
-    transactions = currency_converter(transactions)
+    # load the cleaned transactions, from the cache when the input files have not changed
+    transactions = load_transactions(root_path)
+    # the rows of every token for saving the results, built once per dataset
+    index = load_row_index(root_path, transactions, 'token_id')
 
     elapsed_time_averages = []
     asymptotic_times = []
     rows = int(len(transactions) / 1000)
     # Run the sorting in batches of 1000, 2000, 3000, ......
+    # The per group state is kept across the batches, every batch only folds in the rows it adds
+    aggregator = FraudFeatureAggregator()
     for i in range(rows + 1):
         print(f"{(i + 1) * 1000} transactions")
 
         n = (i + 1) * 1000
 
         # run the query for a specified number of runs
-        aveg_elapsed_time_ns = run_n_times(transactions[0: n], no_of_runs, save= i == rows)
+        aggregator.update(transactions[n - 1000: n])
+        aveg_elapsed_time_ns = run_n_times(transactions[0: n], no_of_runs, save= i == rows, data=aggregated_data(aggregator), index=index)
         elapsed_time_averages.append(aveg_elapsed_time_ns)
 
         # this is used to ensure both the asymptotic and actual run time have the same scale while plotting the graph
@@ -444,10 +215,30 @@ def main():
                
     # run_query(transactions, run=1)
 
-def run_n_times(transactions, n, save=False):
+def main_stream(chunksize):
+    # Read the csv files a chunk at a time and only keep the per token state, for datasets that do not fit in memory
+    aggregator = FraudFeatureAggregator()
+    n = stream_into(root_path, [aggregator], chunksize)
+    print(f"{n} transactions")
+
+    data = aggregated_data(aggregator)
+
+    # collect start time
+    start_time = time.time_ns()
+    sorted_txns = sort_data(data)
+    # collect end time
+    end_time = time.time_ns()
+
+    elapsed_time = (end_time - start_time)
+    print(f"\nThe elapsed time is {elapsed_time} nano secs (i.e {elapsed_time/1e9} secs)\n")
+
+    # the transactions themselves are not kept, so only the per token results are saved
+    save_result(sorted_txns, None, elapsed_time)
+
+def run_n_times(transactions, n, data, save=False, index=None):
     elapsed_times = []
     for i in range(n):
-        elapsed_time, sorted_txns = run_query(transactions, save=save)
+        elapsed_time, sorted_txns = run_query(transactions, save=save, data=data, index=index)
         elapsed_times.append(elapsed_time)
 
     aveg_elapsed_time_ns = sum(elapsed_times)/len(elapsed_times)
@@ -457,45 +248,56 @@ def run_n_times(transactions, n, save=False):
     return aveg_elapsed_time_ns
 
 
-def run_query(transactions, save=False):
-    data = process_data(transactions)
+def run_query(transactions, data, save=False, index=None):
+    # data is the aggregated transactions, kept up to date incrementally by the caller, the sort gets its own copy
+    data = list(data)
 
     start_time1 = time.time_ns()
-    sorted_txns = merge_sort_by_fraudulent(data)
+    sorted_txns = sort_by_fraudulent(data)
     end_time1 = time.time_ns()
 
     elapsed_time = (end_time1 - start_time1)
 
     if save:
-        save_result(sorted_txns, transactions, elapsed_time)
+        save_result(sorted_txns, transactions, elapsed_time, index)
 
     return elapsed_time, sorted_txns
 
-def process_data(A: List[NFTTransaction]):
-    hash = {}
-    for row in A:
-        if row.token_id in hash:
-            hash[row.token_id].append(row)
-        else:
-            hash[row.token_id] = [row]
-        
-    transactions = []
-    for key in hash:
-        transactions = np.concatenate((transactions, hash[key]))
-
-    A = update_with_n_unique_txns(transactions)
+def aggregated_data(aggregator: FraudFeatureAggregator) -> List[Query6Data]:
+    data = []
+    for token_id, first_buy_date, last_buy_date, second_last_buy_date, third_last_buy_date, n_txns, n_buyers, buy_minutes in aggregator.results():
+        data.append(get_txn(first_buy_date, last_buy_date, second_last_buy_date, third_last_buy_date, token_id, n_txns, n_buyers, buy_minutes))
+
+    return data
+
+def sort_data(data: List[Query6Data]) -> List[Query6Data]:
+    return sort_by_fraudulent(data)
+
+def process_data(A: TransactionTable, index: Optional[RowIndex] = None):
+    # rows grouped by token id, the groups in order of first appearance. The row index of the dataset has that
+    # grouping already, only a table without one is grouped here
+    if index is not None:
+        return update_with_n_unique_txns(A[index.order], index.offsets)
+
+    rows = group_by(A.token_id).order
+
+    A = update_with_n_unique_txns(A[rows])
     return A
 
 if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--stream", action="store_true", help="read the csv files in chunks instead of all at once")
+    parser.add_argument("--chunksize", type=int, default=DEFAULT_CHUNKSIZE, help="rows per chunk in streaming mode")
+    parser.add_argument("--sort", choices=list(SORT_BACKENDS), default=sort_backend, help="backend of the ranking sort")
+    parser.add_argument("--workers", type=int, default=None, help="aggregate hash shards of the transactions in this many processes")
+    args = parser.parse_args()
+
+    sort_backend = args.sort
+
     # declare root path
     global root_path
     root_path = os.getcwd()
 
-    print("Kindly specify the number of runs needed (suggested runs is 1), Example : 1")
-    # No of times the script need to be run
-    global no_of_runs
-    no_of_runs = int(input())
-
     # Output path to store results
     global output_path
     output_path = root_path + "/output"
@@ -503,4 +305,14 @@ if __name__ == "__main__":
     if not os.path.isdir(output_path):
         os.mkdir(output_path)
 
-    main()
+    if args.stream:
+        main_stream(args.chunksize)
+    elif args.workers:
+        main_sharded(sys.modules[__name__], process_data, 'token_id', root_path, args.workers)
+    else:
+        print("Kindly specify the number of runs needed (suggested runs is 1), Example : 1")
+        # No of times the script need to be run
+        global no_of_runs
+        no_of_runs = int(input())
+
+        main()
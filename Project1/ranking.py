@@ -0,0 +1,8 @@
+# imports
+import heapq
+from typing import Callable, List
+
+def top_k(data: list, k: int, key: Callable) -> List:
+    # The k records with the largest keys, in the order the full rankings put them: descending by key, and ties
+    # latest first (see sorting.py). Only a heap of k records is kept, so this takes O(n log k) instead of sorting all n
+    return [record for _, _, record in heapq.nlargest(k, ((key(record), i, record) for i, record in enumerate(data)))]
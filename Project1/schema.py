@@ -0,0 +1,48 @@
+# imports
+import pandas as pd
+import numpy as np
+from datetime import datetime, timedelta
+
+# Declared types of the columns of the transaction csv files, so that read_csv does not have to infer them. Columns
+# with few distinct values are read as categories. The integer columns are read as pandas' nullable integers, so a
+# file with missing values still reads, and become plain int64 once the null records are dropped
+TRANSACTION_SCHEMA = {
+    'Txn Hash': 'object',
+    'UnixTimestamp': 'Int64',
+    'Date Time (UTC)': 'category',
+    'Action': 'category',
+    'Buyer': 'category',
+    'NFT': 'category',
+    'Token ID': 'Int64',
+    'Type': 'category',
+    'Quantity': 'Int64',
+    'Price': 'object',
+    'Market': 'category',
+}
+
+DATE_TIME_FORMAT = "%m/%d/%Y %H:%M"
+
+# Minutes value of a date that could not be parsed
+NOT_A_TIME = np.iinfo(np.int64).min
+
+def read_transactions(path: str, **kwargs):
+    # Every column is still read: null and duplicate records are judged on whole rows
+    return pd.read_csv(path, dtype=TRANSACTION_SCHEMA, **kwargs)
+
+def drop_nulls(data: pd.DataFrame) -> pd.DataFrame:
+    # drop all null records, the nullable integer columns are then stored as int64
+    data = data.dropna()
+    return data.astype({column: np.int64 for column, dtype in TRANSACTION_SCHEMA.items() if dtype == 'Int64'})
+
+def parse_date_times(values) -> np.ndarray:
+    # Minutes since the epoch of every date string, NOT_A_TIME for values that are not in DATE_TIME_FORMAT. Callers
+    # pass the distinct values, so every date is only parsed once
+    minutes = np.full(len(values), NOT_A_TIME, dtype=np.int64)
+    epoch = datetime(1970, 1, 1)
+    for i, value in enumerate(values):
+        try:
+            minutes[i] = (datetime.strptime(str(value), DATE_TIME_FORMAT) - epoch) // timedelta(minutes=1)
+        except ValueError:
+            pass
+
+    return minutes
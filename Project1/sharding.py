@@ -0,0 +1,95 @@
+# imports
+import os
+import time
+import pandas as pd
+import numpy as np
+from typing import Callable, Dict, List, Optional, Sequence, Tuple
+from concurrent.futures import ProcessPoolExecutor
+from transaction_table import TransactionTable
+from grouping import RowIndex
+from dataset import load_transactions, load_row_index
+from aggregators import feed
+
+##################################################### Sharding ##############################################
+#
+# The aggregations are independent per token or per buyer, so the transactions can be split by a hash of the group
+# key into shards that are aggregated in parallel worker processes. Every group is in exactly one shard and its rows
+# stay in their original order, so the results of a shard are already final for its groups and merging the shards
+# only puts the groups back in the order they first appear in the whole table.
+#
+# The workers are only sent the rows of their shard: they reopen the cached transactions, a memory map that every
+# process shares, instead of being sent a copy of the table and its vocabularies. The shards are cut from the row
+# index of the dataset, so their rows come grouped and the workers do not group them again. A task is anything that
+# takes a table and its RowIndex and returns one result per group in order of first appearance, e.g. a query's
+# process_data.
+
+def shard_groups(index: RowIndex, n_shards: int) -> List[Tuple[np.ndarray, np.ndarray, RowIndex]]:
+    # The groups of every shard, in order, with the rows of those groups one group after another. The RowIndex of a
+    # shard indexes those rows within the shard, so every group is a run of it
+    group_shards = pd.util.hash_array(index.keys) % np.uint64(n_shards)
+    sizes = np.diff(index.offsets)
+    row_shards = np.repeat(group_shards, sizes)
+
+    shards = []
+    for shard in range(n_shards):
+        groups = np.flatnonzero(group_shards == shard)
+        rows = index.order[row_shards == shard]
+        offsets = np.zeros(len(groups) + 1, dtype=np.int64)
+        np.cumsum(sizes[groups], out=offsets[1:])
+        shards.append((groups, rows, RowIndex(keys=index.keys[groups], order=np.arange(len(rows)), offsets=offsets)))
+
+    return shards
+
+def aggregate_with(aggregator, results: Callable, data: TransactionTable, index: Optional[RowIndex] = None) -> list:
+    # a task that folds the table into an aggregator, e.g. the sketches of --approximate, and reads its results
+    feed([aggregator], data)
+    return results(aggregator)
+
+def aggregate_shard(root_path: str, rows: np.ndarray, index: RowIndex, tasks: Sequence[Callable]) -> list:
+    # the results of every task over one shard
+    shard = load_transactions(root_path)[rows]
+    return [task(shard, index) for task in tasks]
+
+def run_sharded(root_path: str, jobs: Sequence[Tuple[Callable, str]], indexes: Dict[str, RowIndex],
+                workers: Optional[int] = None) -> List[list]:
+    # Run (task, column) jobs over shards of the cached transactions in one process pool. The table is sharded once
+    # per column, by the row index of that column in indexes, and every task that groups by that column runs on the
+    # same shards. The results come back in the order of the jobs
+    workers = workers or os.cpu_count() or 1
+    columns = list(dict.fromkeys(column for _, column in jobs))
+    merged: List[list] = [[] for _ in jobs]
+
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        for column in columns:
+            positions = [i for i, (_, job_column) in enumerate(jobs) if job_column == column]
+            tasks = [jobs[i][0] for i in positions]
+            shards = shard_groups(indexes[column], workers)
+            parts = list(executor.map(aggregate_shard, [root_path] * len(shards), [rows for _, rows, _ in shards],
+                                      [index for _, _, index in shards], [tasks] * len(shards)))
+
+            # the groups of the index are in order of first appearance, merging the shards is ordering them by group
+            groups = np.concatenate([groups for groups, _, _ in shards])
+            order = np.argsort(groups, kind='stable').tolist()
+            for j, i in enumerate(positions):
+                results = [result for part in parts for result in part[j]]
+                merged[i] = [results[k] for k in order]
+
+    return merged
+
+def main_sharded(query, task: Callable, column: str, root_path: str, workers: Optional[int] = None) -> None:
+    # The --workers mode of a query: aggregate the shards in parallel, then sort and save like the other modes
+    transactions = load_transactions(root_path)
+    index = load_row_index(root_path, transactions, column)
+    [data] = run_sharded(root_path, [(task, column)], {column: index}, workers)
+    print(f"{len(transactions)} transactions")
+
+    # collect start time
+    start_time = time.time_ns()
+    sorted_txns = query.sort_data(data)
+    # collect end time
+    end_time = time.time_ns()
+
+    elapsed_time = (end_time - start_time)
+    print(f"\nThe elapsed time is {elapsed_time} nano secs (i.e {elapsed_time/1e9} secs)\n")
+
+    query.save_result(sorted_txns, transactions, elapsed_time, index)
@@ -0,0 +1,104 @@
+# imports
+import argparse
+import warnings
+import pandas as pd
+import numpy as np
+from interning import Interner
+
+################################################### HyperLogLog ##############################################
+#
+# Approximate distinct counts per group in fixed memory. Every group has a HyperLogLog sketch of 2^p one byte
+# registers: a value's 64 bit hash picks a register by its top p bits, and the register keeps the highest rank (the
+# number of leading zeros of the rest of the hash, plus one) seen. The relative standard error of an estimate is
+# 1.04 / sqrt(2^p). Values are hashed by their text, not their codes, so sketches built from different files, shards
+# or days can be merged by taking the register wise maximum.
+
+MIN_PRECISION = 4
+MAX_PRECISION = 16
+
+def precision_for(error: float) -> int:
+    # smallest number of register bits p whose relative standard error is at most error
+    if not np.isfinite(error) or error <= 0:
+        raise ValueError(f"the error bound must be a positive number, got {error}")
+
+    p = int(np.ceil(np.log2((1.04 / error) ** 2)))
+    if p > MAX_PRECISION:
+        warnings.warn(f"an error bound of {error} needs 2^{p} registers per group, the sketches are limited to "
+                      f"2^{MAX_PRECISION} whose relative standard error is {1.04 / np.sqrt(1 << MAX_PRECISION):.4f}")
+    return min(max(p, MIN_PRECISION), MAX_PRECISION)
+
+def error_bound(text: str) -> float:
+    # argparse type of --approximate: a positive relative standard error
+    error = float(text)
+    if not np.isfinite(error) or error <= 0:
+        raise argparse.ArgumentTypeError(f"the error bound must be a positive number, got {text}")
+    return error
+
+def hash_text(values) -> np.ndarray:
+    return pd.util.hash_array(np.asarray(values, dtype=object))
+
+def leading_zeros(x: np.ndarray) -> np.ndarray:
+    # number of leading zero bits of every uint64, by binary search over the bit positions
+    x = x.copy()
+    n = np.zeros(len(x), dtype=np.int64)
+    for shift in (32, 16, 8, 4, 2, 1):
+        is_short = x < np.uint64(1 << (64 - shift))
+        n[is_short] += shift
+        x[is_short] <<= np.uint64(shift)
+    n[x == 0] = 64
+
+    return n
+
+class GroupSketches:
+    # One HyperLogLog sketch per group key, the groups in order of first appearance
+    def __init__(self, error: float = 0.05) -> None:
+        self.p = precision_for(error)
+        self.m = 1 << self.p
+        self.groups = Interner()
+        self.registers = np.zeros((16, self.m), dtype=np.uint8)
+
+    def __len__(self) -> int:
+        return len(self.groups)
+
+    def error(self) -> float:
+        # relative standard error of the estimates
+        return 1.04 / np.sqrt(self.m)
+
+    def keys(self) -> np.ndarray:
+        return np.asarray(self.groups)
+
+    def grow(self) -> None:
+        if len(self.groups) > len(self.registers):
+            capacity = max(2 * len(self.registers), len(self.groups))
+            self.registers = np.concatenate((self.registers, np.zeros((capacity - len(self.registers), self.m), dtype=np.uint8)))
+
+    def add(self, keys, hashes: np.ndarray) -> np.ndarray:
+        # Add the value hashes to the sketches of their groups, returns the group number of every key
+        groups = self.groups.intern(keys)
+        self.grow()
+
+        registers = (hashes >> np.uint64(64 - self.p)).astype(np.intp)
+        ranks = np.minimum(leading_zeros(hashes << np.uint64(self.p)), 64 - self.p) + 1
+        np.maximum.at(self.registers, (groups, registers), ranks.astype(np.uint8))
+
+        return groups
+
+    def merge(self, other: "GroupSketches") -> None:
+        if other.p != self.p:
+            raise ValueError("only sketches with the same precision can be merged")
+
+        groups = self.groups.intern(other.keys())
+        self.grow()
+        self.registers[groups] = np.maximum(self.registers[groups], other.registers[:len(other)])
+
+    def estimates(self) -> np.ndarray:
+        registers = self.registers[:len(self)].astype(np.float64)
+        alpha = 0.7213 / (1 + 1.079 / self.m)
+        estimates = alpha * self.m * self.m / np.sum(np.exp2(-registers), axis=1)
+
+        # small cardinalities are counted from the number of empty registers instead (linear counting)
+        empty = np.count_nonzero(registers == 0, axis=1)
+        is_small = (estimates <= 2.5 * self.m) & (empty > 0)
+        estimates[is_small] = self.m * np.log(self.m / empty[is_small])
+
+        return estimates
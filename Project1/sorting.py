@@ -0,0 +1,161 @@
+# imports
+import os
+import heapq
+import numpy as np
+from concurrent.futures import ProcessPoolExecutor
+from typing import Callable, Dict, List, Optional, Sequence, Union
+
+##################################################### Sorting ##############################################
+#
+# One sort for the rankings of all the queries. A sort takes the records and either a key extractor or an array of
+# keys (or several of them, most significant first), returns the records ordered by key and is always stable: equal
+# keys keep their input order, or the reverse of it with latest_first (the radix sorts of the queries used to sort
+# ascending and reverse the result, which puts equal keys latest first). Every backend computes a permutation of the
+# keys, only the records are moved at the end, and every backend gives the same order so they can be swapped and
+# benchmarked against each other on one input.
+#
+#   radix     LSD radix sort over NumPy keys, RADIX_BITS bits a pass
+#   merge     bottom up merge sort of the permutation between two buffers
+#   counting  single counting sort pass with one bucket per distinct key
+#   timsort   Python's sorted()
+#   parallel  merge sort of per core chunks in worker processes, then a k-way merge of the sorted runs with a heap
+
+RADIX_BITS = 16
+
+# Worker processes of the parallel backend (None uses every core), and the number of keys below which it sorts in
+# this process since starting the pool would cost more than the sort
+PARALLEL_WORKERS = None
+PARALLEL_MIN_KEYS = 100000
+
+def dense_ranks(values) -> np.ndarray:
+    # rank of every value among the distinct values, so any keys (prices, text converted to a number) can be sorted
+    # as small non negative integers
+    return np.unique(np.asarray(values), return_inverse=True)[1].reshape(-1)
+
+def integer_keys(keys: np.ndarray, descending: bool) -> np.ndarray:
+    # non negative integers in the order of the keys, complemented (max - key) for a descending sort
+    if keys.dtype.kind not in 'iu' or (len(keys) and keys.min() < 0):
+        keys = dense_ranks(keys)
+    keys = keys.astype(np.int64)
+
+    return keys.max() - keys if descending and len(keys) else keys
+
+def radix_argsort(keys: np.ndarray, descending: bool = False) -> np.ndarray:
+    # Every pass is a stable counting sort of the permutation by one digit (numpy sorts 16 bit integers with a
+    # counting radix sort when asked for a stable sort). Counts below 2^16 are sorted in a single pass
+    keys = integer_keys(keys, descending).astype(np.uint64)
+    perm = np.arange(len(keys))
+    if len(keys) == 0:
+        return perm
+
+    mask = np.uint64((1 << RADIX_BITS) - 1)
+    top = int(keys.max())
+    shift = 0
+    while top >> shift:
+        digits = ((keys[perm] >> np.uint64(shift)) & mask).astype(np.uint16)
+        perm = perm[np.argsort(digits, kind='stable')]
+        shift += RADIX_BITS
+
+    return perm
+
+def merge_argsort(keys: np.ndarray, descending: bool = False) -> np.ndarray:
+    # Bottom up: runs of width 1, 2, 4, ... are merged pairwise from one buffer of row numbers into the other, then
+    # the buffers swap roles. Both are allocated once, there is no recursion and no slicing
+    keys = keys.tolist()
+    n = len(keys)
+    src = list(range(n))
+    dst = [0] * n
+
+    width = 1
+    while width < n:
+        for lo in range(0, n, 2 * width):
+            mid = min(lo + width, n)
+            hi = min(lo + 2 * width, n)
+            i, j = lo, mid
+            for k in range(lo, hi):
+                # taking from the left run on equal keys keeps the sort stable
+                if j >= hi or (i < mid and (keys[src[i]] >= keys[src[j]] if descending else keys[src[i]] <= keys[src[j]])):
+                    dst[k] = src[i]
+                    i = i + 1
+                else:
+                    dst[k] = src[j]
+                    j = j + 1
+
+        src, dst = dst, src
+        width *= 2
+
+    return np.array(src, dtype=np.int64)
+
+def counting_argsort(keys: np.ndarray, descending: bool = False) -> np.ndarray:
+    keys = integer_keys(keys, descending)
+    if len(keys) and keys.max() >= 2 * len(keys):
+        # wide keys would need more buckets than records, rank them first
+        keys = dense_ranks(keys)
+
+    # the first position of every key, then every record is placed after the earlier ones with the same key
+    counts = np.bincount(keys) if len(keys) else np.zeros(0, dtype=np.int64)
+    positions = (np.cumsum(counts) - counts).tolist()
+    perm = [0] * len(keys)
+    for i, key in enumerate(keys.tolist()):
+        perm[positions[key]] = i
+        positions[key] += 1
+
+    return np.array(perm, dtype=np.int64)
+
+def timsort_argsort(keys: np.ndarray, descending: bool = False) -> np.ndarray:
+    # sorted() is stable with reverse=True too
+    keys = keys.tolist()
+    return np.array(sorted(range(len(keys)), key=keys.__getitem__, reverse=descending), dtype=np.int64)
+
+def parallel_merge_argsort(keys: np.ndarray, descending: bool = False) -> np.ndarray:
+    # Every chunk is merge sorted in a worker, merge_argsort staying the reference sort. heapq.merge takes equal keys
+    # from the earlier run first and the chunks are in input order, so the result is stable like the sequential sort
+    workers = PARALLEL_WORKERS or os.cpu_count() or 1
+    if workers == 1 or len(keys) < PARALLEL_MIN_KEYS:
+        return merge_argsort(keys, descending)
+
+    bounds = np.linspace(0, len(keys), workers + 1).astype(np.int64)
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        perms = list(executor.map(merge_argsort, [keys[start: end] for start, end in zip(bounds, bounds[1:])],
+                                  [descending] * workers))
+
+    runs = [(perm + start).tolist() for perm, start in zip(perms, bounds)]
+    keys = keys.tolist()
+    return np.fromiter(heapq.merge(*runs, key=keys.__getitem__, reverse=descending), dtype=np.int64, count=len(keys))
+
+SORT_BACKENDS: Dict[str, Callable] = {
+    'radix': radix_argsort,
+    'merge': merge_argsort,
+    'counting': counting_argsort,
+    'timsort': timsort_argsort,
+    'parallel': parallel_merge_argsort,
+}
+
+def argsort(keys, descending: bool = False, latest_first: bool = False, backend: str = 'radix') -> np.ndarray:
+    return multikey_argsort([keys], descending, latest_first, backend)
+
+def multikey_argsort(keys: Sequence, descending: bool = False, latest_first: bool = False, backend: str = 'radix') -> np.ndarray:
+    # Sort by several keys, the first one the most significant: one stable pass per key, from the least significant
+    # one up (LSD), so records that tie on a key stay in the order the later keys put them in
+    if backend not in SORT_BACKENDS:
+        raise ValueError(f"unknown sort backend {backend}, expected one of {', '.join(SORT_BACKENDS)}")
+
+    # equal keys latest first: sort the reversed keys stably and map the positions back
+    n = len(keys[0])
+    perm = np.arange(n)[::-1] if latest_first else np.arange(n)
+    for key in reversed(keys):
+        perm = perm[SORT_BACKENDS[backend](np.asarray(key)[perm], descending)]
+
+    return perm
+
+def sort_records(records: List, key: Union[Callable, np.ndarray, Sequence, None] = None, descending: bool = False,
+                 latest_first: bool = False, backend: str = 'radix', keys: Optional[Sequence] = None) -> List:
+    # key is a key extractor or an array (or list) of keys. To sort by several keys, pass them as keys instead, each
+    # an extractor or an array, the most significant first
+    if (key is None) == (keys is None):
+        raise ValueError("sort_records takes either key or keys")
+
+    keys = [key] if keys is None else list(keys)
+    keys = [np.array([k(record) for record in records]) if callable(k) else np.asarray(k) for k in keys]
+
+    return [records[i] for i in multikey_argsort(keys, descending, latest_first, backend).tolist()]
@@ -0,0 +1,51 @@
+# imports
+import os
+import glob
+from typing import Iterator, List, Optional
+from transaction_table import TransactionTable, prepare_data, currency_converter
+from interning import Interner
+from schema import read_transactions, drop_nulls
+from dedupe import Deduplicator, KEY_COLUMNS, transaction_keys
+
+# Rows read from a csv file at a time in streaming mode
+DEFAULT_CHUNKSIZE = 100000
+
+# Columns the aggregators group or count by. They are interned across the whole stream so a buyer, NFT or txn hash
+# gets the same code in every chunk, the other columns are only interned per chunk
+STREAM_INTERNED_COLUMNS = ['txn_hash', 'buyer', 'nft']
+
+def stream_transactions(files: List[str], chunksize: int = DEFAULT_CHUNKSIZE,
+                        deduplicator: Optional[Deduplicator] = None) -> Iterator[TransactionTable]:
+    # Read the files a chunk at a time so only one chunk of raw rows is ever in memory. Each chunk is cleaned and
+    # converted the same way as the whole dataset is when it is loaded at once
+    deduplicator = deduplicator or Deduplicator()
+    interners = {name: Interner() for name in STREAM_INTERNED_COLUMNS}
+    for f in files:
+        for chunk in read_transactions(f, chunksize=chunksize):
+            # drop all null records
+            chunk = drop_nulls(chunk)
+
+            # drop all duplicate transactions, including the ones already seen in earlier chunks and files
+            chunk = chunk[deduplicator.is_new(transaction_keys(chunk[KEY_COLUMNS]), os.path.basename(f))]
+
+            if len(chunk) == 0:
+                continue
+
+            transactions = prepare_data(chunk, interners)
+            yield currency_converter(transactions)
+
+def stream_into(root_path: str, aggregators: list, chunksize: int = DEFAULT_CHUNKSIZE, bloom_capacity: Optional[int] = None,
+                exact: bool = True) -> int:
+    # Feed every chunk of the csv files in root_path to the aggregators, returns the number of transactions read.
+    # bloom_capacity and exact are the Bloom filter options of the Deduplicator, exact=False bounds its memory
+    files = glob.glob(root_path + "/*.csv")
+
+    deduplicator = Deduplicator(bloom_capacity, exact=exact)
+    n = 0
+    for transactions in stream_transactions(files, chunksize, deduplicator):
+        for aggregator in aggregators:
+            aggregator.update(transactions)
+        n += len(transactions)
+    print(deduplicator.report())
+
+    return n
@@ -0,0 +1,165 @@
+# imports
+import numpy as np
+from typing import Dict, List, Optional
+from dataclasses import dataclass, field, fields
+from currency import convert_prices
+from interning import Interner
+from schema import parse_date_times
+
+##################################################### Data ###################################################
+
+@dataclass(order=True, slots=True)
+class NFTTransaction:
+    txn_hash: str
+    time_stamp: str
+    date_time: str
+    action: str
+    buyer: str
+    nft: str
+    token_id: int
+    type_: int
+    quantity: int
+    price: float
+    price_str: str
+    market: str
+    n_unique_buyers: int
+
+# Columns that are stored as small integer codes into a per-column vocabulary (an Interner of the distinct strings)
+CODED_COLUMNS = ['txn_hash', 'date_time', 'action', 'buyer', 'nft', 'type_', 'price_str', 'market']
+
+# Source column in the csv files for every column of the table
+SOURCE_COLUMNS = {
+    'txn_hash': 'Txn Hash',
+    'time_stamp': 'UnixTimestamp',
+    'date_time': 'Date Time (UTC)',
+    'action': 'Action',
+    'buyer': 'Buyer',
+    'nft': 'NFT',
+    'token_id': 'Token ID',
+    'type_': 'Type',
+    'quantity': 'Quantity',
+    'price_str': 'Price',
+    'market': 'Market',
+}
+
+def to_text(values):
+    # Vocabularies opened from a column file are utf-8 bytes, only the values looked up get decoded
+    if isinstance(values, bytes):
+        return values.decode('utf-8')
+    if isinstance(values, np.ndarray) and values.dtype.kind == 'S':
+        return np.char.decode(values, 'utf-8')
+    return values
+
+@dataclass
+class TransactionTable:
+    # One typed array per column, all of the same length. Coded columns hold int32 codes into vocab[column]
+    txn_hash: np.ndarray
+    time_stamp: np.ndarray
+    date_time: np.ndarray
+    action: np.ndarray
+    buyer: np.ndarray
+    nft: np.ndarray
+    token_id: np.ndarray
+    type_: np.ndarray
+    quantity: np.ndarray
+    price: np.ndarray
+    price_str: np.ndarray
+    market: np.ndarray
+    # date_time parsed to minutes since the epoch
+    date_minutes: np.ndarray
+    vocab: Dict[str, np.ndarray] = field(default_factory=dict)
+
+    def __len__(self) -> int:
+        return len(self.token_id)
+
+    def __getitem__(self, rows) -> "TransactionTable":
+        # transactions[0: n] returns views over the same column arrays, the vocabularies are shared
+        columns = {f.name: getattr(self, f.name)[rows] for f in fields(self) if f.name != 'vocab'}
+        return TransactionTable(**columns, vocab=self.vocab)
+
+    def to_columns(self) -> Dict[str, np.ndarray]:
+        # Flat name -> array mapping used to store the table, vocabularies are stored as "vocab/<column>"
+        columns = {f.name: getattr(self, f.name) for f in fields(self) if f.name != 'vocab'}
+        for name, values in self.vocab.items():
+            columns['vocab/' + name] = np.asarray(values)
+
+        return columns
+
+    @classmethod
+    def from_columns(cls, columns: Dict[str, np.ndarray]) -> "TransactionTable":
+        vocab = {name[len('vocab/'):]: values for name, values in columns.items() if name.startswith('vocab/')}
+        return cls(**{name: values for name, values in columns.items() if not name.startswith('vocab/')}, vocab=vocab)
+
+    def text(self, column: str, codes):
+        return to_text(self.vocab[column][codes])
+
+    def decode(self, column: str, rows=slice(None)) -> np.ndarray:
+        return self.text(column, getattr(self, column)[rows])
+
+    def row(self, i: int) -> NFTTransaction:
+        return NFTTransaction(
+            txn_hash=self.text('txn_hash', self.txn_hash[i]),
+            time_stamp=self.time_stamp[i],
+            date_time=self.text('date_time', self.date_time[i]),
+            action=self.text('action', self.action[i]),
+            buyer=self.text('buyer', self.buyer[i]),
+            nft=self.text('nft', self.nft[i]),
+            token_id=self.token_id[i],
+            type_=self.text('type_', self.type_[i]),
+            quantity=self.quantity[i],
+            price=self.price[i],
+            price_str=self.text('price_str', self.price_str[i]),
+            market=self.text('market', self.market[i]),
+            n_unique_buyers=0)
+
+    def rows(self, rows=slice(None)) -> List[NFTTransaction]:
+        # Records of many rows at once: each column is gathered and decoded in one go and the columns are zipped,
+        # which is much cheaper than a row() call per row
+        columns = [self.decode(f.name, rows) if f.name in CODED_COLUMNS else getattr(self, f.name)[rows]
+                   for f in fields(NFTTransaction) if f.name != 'n_unique_buyers']
+        return [NFTTransaction(*values, 0) for values in zip(*(np.asarray(column).tolist() for column in columns))]
+
+########################################## Utils #####################################################
+
+def prepare_data(data, interners: Optional[Dict[str, Interner]] = None) -> TransactionTable:
+    # Columns that have an interner passed in are encoded with it, so that chunks of a stream get the same codes for
+    # the same strings. Every other column gets an interner of its own
+    vocab = {name: Interner() for name in CODED_COLUMNS}
+    vocab.update(interners or {})
+
+    columns = {}
+    for name in CODED_COLUMNS:
+        columns[name] = vocab[name].intern(data[SOURCE_COLUMNS[name]])
+
+    columns['time_stamp'] = data['UnixTimestamp'].to_numpy(dtype=np.int64)
+    columns['token_id'] = data['Token ID'].to_numpy(dtype=np.int64)
+    columns['quantity'] = data['Quantity'].to_numpy(dtype=np.int64)
+    columns['price'] = np.zeros(len(data), dtype=np.float64)
+
+    # every distinct date of the table is parsed once, then gathered back to the rows through the codes
+    used, rows = np.unique(columns['date_time'], return_inverse=True)
+    columns['date_minutes'] = parse_date_times(vocab['date_time'][used].tolist())[rows]
+
+    return TransactionTable(**columns, vocab=vocab)
+
+def concat_tables(tables: List[TransactionTable]) -> TransactionTable:
+    # Stack the rows of tables that were encoded separately. Each table's vocabulary is interned into a merged one,
+    # in order, which gives the remapping of that table's codes
+    columns = {}
+    vocab = {}
+    for name in CODED_COLUMNS:
+        vocab[name] = Interner()
+        columns[name] = np.concatenate([vocab[name].intern(table.vocab[name])[getattr(table, name)] for table in tables])
+
+    for f in fields(TransactionTable):
+        if f.name != 'vocab' and f.name not in CODED_COLUMNS:
+            columns[f.name] = np.concatenate([getattr(table, f.name) for table in tables])
+
+    return TransactionTable(**columns, vocab=vocab)
+
+def currency_converter(data: TransactionTable) -> TransactionTable:
+    # Every distinct price string of the table is converted once, then gathered back to the rows through the codes
+    used, rows = np.unique(data.price_str, return_inverse=True)
+    data.price = convert_prices(data.vocab['price_str'][used])[rows]
+
+    return data
@@ -0,0 +1,43 @@
+# imports
+import time
+from typing import List
+from dataset import load_dataset
+from query4 import NFTTransaction, convert_to_object_list
+
+# Times building the transaction records the queries work on: the iterrows builder the queries used before against
+# the column zip in convert_to_object_list
+
+def convert_with_iterrows(data) -> List[NFTTransaction]:
+    transactions = []
+    for i, row in data.iterrows():
+        transactions.append(NFTTransaction(
+            txn_hash=row['Txn Hash'],
+            time_stamp=row['UnixTimestamp'],
+            date_time=row['Date Time (UTC)'],
+            buyer=row['Buyer'],
+            token_id=row['Token ID'],
+            price_str=row['Price'],
+            price=0.0))
+
+    return transactions
+
+def time_ns(function, data, runs):
+    # best of runs, in nano secs
+    elapsed_times = []
+    for i in range(runs):
+        start_time = time.time_ns()
+        function(data)
+        elapsed_times.append(time.time_ns() - start_time)
+
+    return min(elapsed_times)
+
+if __name__ == "__main__":
+    nft_txns = load_dataset("dataset.csv")
+    nft_txns = nft_txns.sort_values(by=['NFT', 'Token ID', 'UnixTimestamp'], ascending=[False, False, True])
+
+    iterrows_time = time_ns(convert_with_iterrows, nft_txns, runs=3)
+    columns_time = time_ns(convert_to_object_list, nft_txns, runs=3)
+
+    print(f"{len(nft_txns)} transactions")
+    print(f"iterrows:     {iterrows_time/1e9} secs")
+    print(f"column zip:   {columns_time/1e9} secs ({iterrows_time/columns_time:.1f}x faster)")
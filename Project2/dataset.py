@@ -0,0 +1,46 @@
+# imports
+import pandas as pd
+import os
+import sys
+
+# The loading modules (schema, currency, dedupe, cache, column_file, interning) are shared with Project1 and live
+# there, Project2's own modules come first on the path
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir, 'Project1'))
+
+from cache import get_cache_path, save_columns, load_columns
+from currency import convert_prices
+from schema import TRANSACTION_SCHEMA, read_transactions, drop_nulls
+from dedupe import Deduplicator, KEY_COLUMNS, transaction_keys
+
+# Columns of the dataset used by the queries
+COLUMNS = ['Txn Hash', 'UnixTimestamp', 'Date Time (UTC)', 'Buyer', 'Token ID', 'NFT', 'Price']
+
+def currency_converter(data):
+  # Split, look up and multiply the whole Price column at once
+  return data.assign(Price=convert_prices(data['Price']))
+
+def load_dataset(path="dataset.csv", use_cache=True, bloom_capacity=None, exact=True) -> pd.DataFrame:
+    # The cleaned and converted columns are cached on disk, keyed by the dataset file, so later runs skip the parsing
+    # Without the exact key set a few unique transactions may be dropped, so those datasets are cached apart
+    name = "dataset" if exact else f"dataset-bloom-{bloom_capacity}"
+    cache_path = get_cache_path(os.path.dirname(os.path.abspath(path)), [path], name)
+    if use_cache and os.path.isfile(cache_path):
+        # the cache stores the categories decoded, give the columns their declared types back
+        data = pd.DataFrame(load_columns(cache_path, decode_text=True))
+        return data.astype({column: TRANSACTION_SCHEMA[column] for column in COLUMNS if TRANSACTION_SCHEMA[column] == 'category'})
+
+    data = read_transactions(path)
+    data = drop_nulls(data)
+
+    # drop all duplicate transactions, bloom_capacity and exact are the Bloom filter options of the Deduplicator
+    deduplicator = Deduplicator(bloom_capacity, exact=exact)
+    data = data[deduplicator.is_new(transaction_keys(data[KEY_COLUMNS]), os.path.basename(path))]
+    print(deduplicator.report())
+
+    nft_txns = data[COLUMNS].reset_index(drop=True)
+    nft_txns = currency_converter(nft_txns)
+
+    if use_cache:
+        save_columns(cache_path, {column: nft_txns[column].to_numpy() for column in COLUMNS})
+
+    return nft_txns
@@ -4,15 +4,16 @@ import sys
 import os
 import math
 import time
-import pandas as pd 
 import numpy as np
 import networkx as nx
 import matplotlib.pyplot as plt
 from collections import defaultdict
 from dataclasses import dataclass
 from typing import List
+from dataset import load_dataset
+from interning import Interner
 
-@dataclass(order=True)
+@dataclass(order=True, slots=True)
 class NFTTransaction:
     txn_hash: str
     time_stamp: str
@@ -22,70 +23,13 @@ class NFTTransaction:
     price: float
     price_str: str
 
-def currency_converter(data):
-  for row in data.itertuples():
-    price = data.at[row.Index, 'Price']
-
-    if type(price) is not str:
-      data.at[row.Index, 'Price'] = float(float(price) * 1.00)
-      continue
-
-    try:
-      price, currency, _ = price.split(" ")
-      price = price.replace(",", "")
-
-      if currency == "ETH":
-        data.at[row.Index, 'Price'] = float(float(price) * 1309.97)
-      
-      elif currency == "WETH":
-        data.at[row.Index, 'Price'] = float(float(price) * 1322.16)
-
-      elif currency == "ASH":
-        data.at[row.Index, 'Price'] = float(float(price) * 0.9406)
-      
-      elif currency == "GALA":
-        data.at[row.Index, 'Price'] = float(float(price) * 0.03748)
-        
-      elif currency == "TATR":
-        data.at[row.Index, 'Price'] = float(float(price) * 0.012056)
-        
-      elif currency == "USDC":
-        data.at[row.Index, 'Price'] = float(float(price) * 1.00)
-        
-      elif currency == "MANA":
-        data.at[row.Index, 'Price'] = float(float(price) * 0.64205)
-        
-      elif currency == "SAND":
-        data.at[row.Index, 'Price'] = float(float(price) * 0.7919)
-        
-      elif currency == "RARI":
-        data.at[row.Index, 'Price'] = float(float(price) * 2.18)
-        
-      elif currency == "CTZN":
-        data.at[row.Index, 'Price'] = float(float(price) * 0.00321)
-        
-      elif currency == "APE":
-        data.at[row.Index, 'Price'] = float(float(price) * 4.62)
-
-      else:
-        data.at[row.Index, 'Price'] = float(float(price) * 1.00)
-
-    except ValueError:
-      None
-      
-  return data
-
 def get_and_prepare_data():
-    data = pd.read_csv("dataset.csv")
-    data = data.dropna()
-    data = data.drop_duplicates()
-
-    nft_txns = data[['Txn Hash', 'UnixTimestamp', 'Date Time (UTC)', 'Buyer', 'Token ID', 'NFT', 'Price']]
+    # load the cleaned and converted dataset, from the cache when dataset.csv has not changed
+    nft_txns = load_dataset("dataset.csv")
 
     # nft_txns = nft_txns.iloc[0:5000]
 
-    nft_txns = currency_converter(nft_txns)
-    unique_buyer_txns = nft_txns.groupby('Buyer', as_index=False).first()
+    unique_buyer_txns = nft_txns.groupby('Buyer', as_index=False, observed=True).first()
     nft_txns = nft_txns.sort_values(by=['NFT', 'Token ID', 'UnixTimestamp'], ascending=[False, False, True])
     nft_txns = convert_to_object_list(nft_txns)
 
@@ -97,18 +41,12 @@ def get_and_prepare_data():
     return nft_txns, unique_buyers, n_unique_buyers, buyer_timestamps, token_ids
 
 def convert_to_object_list(data) -> List[NFTTransaction]:
-    transactions = []
-    for i, row in data.iterrows():
-        transactions.append(NFTTransaction(
-            txn_hash=row['Txn Hash'], 
-            time_stamp=row['UnixTimestamp'],
-            date_time=row['Date Time (UTC)'],
-            buyer=row['Buyer'],
-            token_id=row['Token ID'],
-            price_str=row['Price'],
-            price=0.0))
-        
-    return transactions
+    # Build the records from whole columns, iterrows would build a pandas Series for every row
+    columns = zip(data['Txn Hash'].tolist(), data['UnixTimestamp'].tolist(), data['Date Time (UTC)'].tolist(),
+                  data['Buyer'].tolist(), data['Token ID'].tolist(), data['Price'].tolist())
+
+    return [NFTTransaction(txn_hash, time_stamp, date_time, buyer, token_id, 0.0, price_str)
+            for txn_hash, time_stamp, date_time, buyer, token_id, price_str in columns]
 
 def plot_graph(asymptotic_runtimes, actual_runtimes, filename="query_5.png", rows=92):
     x_axis = [i for i in range(rows+1)]
@@ -130,7 +68,7 @@ class Graph:
         self.token_ids = token_ids
 
         self.n_buyers = 0
-        self.buyers = []
+        self.buyers = Interner()
         self.graph = defaultdict(list)
 
         self.scc_output = []
@@ -141,8 +79,8 @@ class Graph:
         self.graph[node1].append(node2)
 
     def add_to_buyers_list(self, buyer):
-        if buyer not in self.buyers:
-            self.buyers.append(buyer)
+        # gives the buyer the next free node number the first time it is seen
+        return self.buyers.code(buyer)
 
     def build(self, data: List[NFTTransaction]) -> None:
         for i in range(1, len(data)):
@@ -151,7 +89,7 @@ class Graph:
             self.add_to_buyers_list(data[i].buyer)
 
             # Create an edge to build the graph
-            self.addEdge(self.buyers.index(data[i-1].buyer), self.buyers.index(data[i].buyer))
+            self.addEdge(self.buyers.code(data[i-1].buyer), self.buyers.code(data[i].buyer))
             self.adjacency_graph.append(f"{data[i-1].buyer} - {data[i].buyer} -> [{data[i].token_id, data[i].price_str, data[i].date_time}] \n")
 
           elif data[i-1].token_id == data[i].token_id and data[i-1].buyer == data[i].buyer and i + 1 < len(data) and data[i].buyer != data[i+1].buyer:
@@ -159,7 +97,7 @@ class Graph:
             self.add_to_buyers_list(data[i+1].buyer)
 
             # Create an edge to build the graph
-            self.addEdge(self.buyers.index(data[i].buyer), self.buyers.index(data[i+1].buyer))
+            self.addEdge(self.buyers.code(data[i].buyer), self.buyers.code(data[i+1].buyer))
             self.adjacency_graph.append(f"{data[i].buyer} - {data[i+1].buyer} -> [{data[i+1].token_id, data[i+1].price_str, data[i+1].date_time}] \n")
             
         self.n_buyers = len(self.buyers)
@@ -3,7 +3,6 @@ import sys
 import os
 import math
 import time
-import pandas as pd 
 import numpy as np
 import networkx as nx
 import matplotlib.pyplot as plt
@@ -11,8 +10,9 @@ from threading import Thread
 from collections import defaultdict
 from dataclasses import dataclass
 from typing import List
+from dataset import load_dataset
 
-@dataclass(order=True)
+@dataclass(order=True, slots=True)
 class NFTTransaction:
     txn_hash: str
     time_stamp: str
@@ -22,70 +22,13 @@ class NFTTransaction:
     price: float
     price_str: str
 
-def currency_converter(data):
-  for row in data.itertuples():
-    price = data.at[row.Index, 'Price']
-
-    if type(price) is not str:
-      data.at[row.Index, 'Price'] = float(float(price) * 1.00)
-      continue
-
-    try:
-      price, currency, _ = price.split(" ")
-      price = price.replace(",", "")
-
-      if currency == "ETH":
-        data.at[row.Index, 'Price'] = float(float(price) * 1309.97)
-      
-      elif currency == "WETH":
-        data.at[row.Index, 'Price'] = float(float(price) * 1322.16)
-
-      elif currency == "ASH":
-        data.at[row.Index, 'Price'] = float(float(price) * 0.9406)
-      
-      elif currency == "GALA":
-        data.at[row.Index, 'Price'] = float(float(price) * 0.03748)
-        
-      elif currency == "TATR":
-        data.at[row.Index, 'Price'] = float(float(price) * 0.012056)
-        
-      elif currency == "USDC":
-        data.at[row.Index, 'Price'] = float(float(price) * 1.00)
-        
-      elif currency == "MANA":
-        data.at[row.Index, 'Price'] = float(float(price) * 0.64205)
-        
-      elif currency == "SAND":
-        data.at[row.Index, 'Price'] = float(float(price) * 0.7919)
-        
-      elif currency == "RARI":
-        data.at[row.Index, 'Price'] = float(float(price) * 2.18)
-        
-      elif currency == "CTZN":
-        data.at[row.Index, 'Price'] = float(float(price) * 0.00321)
-        
-      elif currency == "APE":
-        data.at[row.Index, 'Price'] = float(float(price) * 4.62)
-
-      else:
-        data.at[row.Index, 'Price'] = float(float(price) * 1.00)
-
-    except ValueError:
-      None
-      
-  return data
-
 def get_and_prepare_data():
-    data = pd.read_csv("dataset.csv")
-    data = data.dropna()
-    data = data.drop_duplicates()
-
-    nft_txns = data[['Txn Hash', 'UnixTimestamp', 'Date Time (UTC)', 'Buyer', 'Token ID', 'NFT', 'Price']]
+    # load the cleaned and converted dataset, from the cache when dataset.csv has not changed
+    nft_txns = load_dataset("dataset.csv")
 
     # nft_txns = nft_txns.iloc[0:5000]
 
-    nft_txns = currency_converter(nft_txns)
-    unique_buyer_txns = nft_txns.groupby('Buyer', as_index=False).first()
+    unique_buyer_txns = nft_txns.groupby('Buyer', as_index=False, observed=True).first()
     nft_txns = nft_txns.sort_values(by=['NFT', 'Token ID', 'UnixTimestamp'], ascending=[False, False, True])
     nft_txns = convert_to_object_list(nft_txns)
 
@@ -97,18 +40,12 @@ def get_and_prepare_data():
     return nft_txns, unique_buyer_txns, unique_buyers, n_unique_buyers, buyer_timestamps, token_ids
 
 def convert_to_object_list(data) -> List[NFTTransaction]:
-    transactions = []
-    for i, row in data.iterrows():
-        transactions.append(NFTTransaction(
-            txn_hash=row['Txn Hash'], 
-            time_stamp=row['UnixTimestamp'],
-            date_time=row['Date Time (UTC)'],
-            buyer=row['Buyer'],
-            token_id=row['Token ID'],
-            price_str=row['Price'],
-            price=0.0))
-        
-    return transactions
+    # Build the records from whole columns, iterrows would build a pandas Series for every row
+    columns = zip(data['Txn Hash'].tolist(), data['UnixTimestamp'].tolist(), data['Date Time (UTC)'].tolist(),
+                  data['Buyer'].tolist(), data['Token ID'].tolist(), data['Price'].tolist())
+
+    return [NFTTransaction(txn_hash, time_stamp, date_time, buyer, token_id, 0.0, price_str)
+            for txn_hash, time_stamp, date_time, buyer, token_id, price_str in columns]
 
 def plot_graph(asymptotic_runtimes, actual_runtimes, filename="query_6.png", rows=92):
     x_axis = [i for i in range(rows+1)]